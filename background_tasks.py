@@ -1,18 +1,24 @@
+import os
 import requests
-import boto3
 from celery import Celery  # Import Celery app
-from utilities import convert_floats_to_decimal
+from celery.signals import worker_process_init, task_prerun, task_postrun
+from utilities import forecast_digest, content_digest
+from weather_store import gridpoint_id_from_url, save_gridpoint_forecast, save_property_weather
+from run_statistics import put_detail_record, build_detail_item, build_background_job_record, DETAILS_TABLE_NAME, BACKGROUND_JOB_RECORD
+from batch_writer import BatchWriter
+from geo_cache import get_cached_coordinates, store_coordinates, get_cached_forecast_url, store_forecast_url, points_cache_key, geocode_cache_key
+from http_client import fetch_json_conditional, iter_fetch_json, http_get, MODIFIED
+from data_access import get_dynamodb, get_weatherlink_item, get_weatherlink_items, put_weatherlink_item
+from instrumentation import timer, increment, get_logger, log_sampled, start_worker_metrics_server
+from profiling import start_task_profile, stop_task_profile
 import time
-from decimal import Decimal
-from botocore.exceptions import ClientError
+from collections import defaultdict
 
-# Connect to DynamoDB
-dynamodb = boto3.resource('dynamodb',
-                          endpoint_url='http://localhost:8000',
-                          region_name='dummy',
-                          aws_access_key_id='dummy',
-                          aws_secret_access_key='dummy'
-                          )
+# Base URLs of the geocoding and weather APIs (overridable to run against a local stub, as the benchmarks do)
+NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org')
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.weather.gov')
+
+logger = get_logger('background_tasks')
 
 # Celery configuration
 app = Celery(
@@ -21,81 +27,139 @@ app = Celery(
     backend='redis://localhost:6379/0'
 )
 
-# Increment atomic counter for API successes
-def increment_api_success(run_id):
-    statistics_table = dynamodb.Table('RunStatistics')
-    try:
-        statistics_table.update_item(
-            Key={'run_id': run_id},
-            UpdateExpression="SET successful_api_calls = if_not_exists(successful_api_calls, :start) + :inc",
-            ExpressionAttributeValues={
-                ':inc': 1,
-                ':start': 0
-            }
-        )
-    except ClientError as e:
-        print(f"Error incrementing API success counter: {e}")
-
-# Add an entry to a list field in DynamoDB for background job details
-def add_to_list(run_id, field, item):
-    statistics_table = dynamodb.Table('RunStatistics')
-    try:
-        statistics_table.update_item(
-            Key={'run_id': run_id},
-            UpdateExpression=f"SET {field} = list_append(if_not_exists({field}, :empty_list), :item)",
-            ExpressionAttributeValues={
-                ':item': [item],
-                ':empty_list': []
-            }
-        )
-    except ClientError as e:
-        print(f"Error appending to {field} in DynamoDB: {e}")
+# Every worker process serves its own stage histograms and counters on a local OpenMetrics endpoint
+worker_process_init.connect(start_worker_metrics_server)
+
+# With PROFILE_MODE set, a sample of the task executions is profiled (see profiling.py)
+task_prerun.connect(start_task_profile)
+task_postrun.connect(stop_task_profile)
 
 # Fetch latitude and longitude for unparsed address from OpenStreetMap API
 def fetch_lat_lon(parsed_address):
-    url = f'https://nominatim.openstreetmap.org/search?q={parsed_address}&format=jsonv2&limit=1'
-    print(f"Fetching coordinates for: {url}")  # Test address parsing by logging the URL
+    lat, lon, _ = request_lat_lon(parsed_address)
+    return lat, lon
+
+# Look up coordinates in the geocode cache, only calling Nominatim on a miss (hits and misses are counted in 'counts')
+def geocode_address(parsed_address, counts):
+    # A feed record without an address can't be geocoded (and must not fail the rest of its chunk)
+    if not parsed_address:
+        log_sampled(logger, "No address to geocode")
+        return None, None
+
+    hit, lat, lon = get_cached_coordinates(get_dynamodb(), parsed_address)
+    if hit:
+        log_sampled(logger, "Geocode cache hit for address: %s", parsed_address)
+        counts['geocode_cache_hits'] += 1
+        increment('geocode_cache_hits')
+        return lat, lon
+
+    counts['geocode_cache_misses'] += 1
+    increment('geocode_cache_misses')
+    lat, lon, definitive = request_lat_lon(parsed_address)
+    # Failed requests are not cached, so the next run retries them
+    if definitive:
+        store_coordinates(get_dynamodb(), parsed_address, lat, lon)
+    return lat, lon
+
+# Request coordinates from Nominatim. Returns (lat, lon, definitive), where 'definitive' is False when the request failed
+@timer('geocode')
+def request_lat_lon(parsed_address):
+    url = f'{NOMINATIM_URL}/search?q={parsed_address}&format=jsonv2&limit=1'
+    log_sampled(logger, "Fetching coordinates for: %s", url)  # Test address parsing by logging the URL
 
     headers = {
         'User-Agent': 'Mozilla/5.0 (compatible; MyParser/1.0; +https://example.com/my-parser)'  # Adds a User-Agent header to avoid detection (Bypasses OSM 403 error)
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        # Rate limited across workers, with Retry-After aware retries
+        response = http_get(url, headers=headers)
         response.raise_for_status()  # Will raise an exception if the response status code is not 200
         data = response.json()
         if data:
             lat = data[0].get('lat')
             lon = data[0].get('lon')
             if lat and lon:
-                print(f"Fetched coordinates: Latitude = {lat}, Longitude = {lon}")
-                return lat, lon
+                log_sampled(logger, "Fetched coordinates: Latitude = %s, Longitude = %s", lat, lon)
+                return lat, lon, True
             else:
-                print(f"Coordinates not found in the response: {data}")
+                logger.warning("Coordinates not found in the response: %s", data)
         else:
-            print(f"Empty JSON response for address: {parsed_address}")
+            log_sampled(logger, "Empty JSON response for address: %s", parsed_address)
     except requests.exceptions.RequestException as e:
-        print(f"Request failed for address: {parsed_address} with error: {e}")
-        time.sleep(1)  # Add a delay to avoid triggering rate limits
-    return None, None
+        logger.warning("Request failed for address: %s with error: %s", parsed_address, e)
+        return None, None, False
+    except ValueError as e:
+        logger.warning("Invalid JSON response for address: %s with error: %s", parsed_address, e)
+        return None, None, False
+    return None, None, True
 
-# Fetch weather data using latitude and longitude
-def fetch_weather_data(lat, lon):
-    weather_url = f'https://api.weather.gov/points/{lat},{lon}'
-    print(f"Fetching weather for coordinates: Latitude = {lat}, Longitude = {lon}")
-    print(f"Getting gridpoints from URL: {weather_url}")
-    
-    response = requests.get(weather_url)
+# Resolve the forecast URL for the coordinates with api.weather.gov /points
+@timer('points')
+def fetch_forecast_url(lat, lon):
+    weather_url = f'{WEATHER_API_URL}/points/{lat},{lon}'
+    log_sampled(logger, "Getting gridpoints from URL: %s", weather_url)
+
+    try:
+        response = http_get(weather_url)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Request to %s failed with error: %s", weather_url, e)
+        return None
     if response.status_code == 200:
         properties = response.json().get('properties')
         if properties and 'forecast' in properties:
-            forecast_url = properties['forecast']
-            print(f"Forecast URL being used: {forecast_url}")
-            forecast_response = requests.get(forecast_url)
-            if forecast_response.status_code == 200:
-                return forecast_response.json(), forecast_url
+            return properties['forecast']
+    logger.warning("Failed to resolve gridpoint for %s,%s, status code: %s", lat, lon, response.status_code)
     return None
 
+# Forecast URL stored on a property's WeatherLink row, only if it was resolved from the address the job has now
+# (a moved property, or a row written before rows recorded their address, is geocoded again)
+def stored_forecast_url_for(weatherlink_item, parsed_address):
+    if parsed_address and weatherlink_item.get('geocode_key') == geocode_cache_key(parsed_address):
+        return weatherlink_item.get('forecast_url')
+    return None
+
+# Fetch the forecast from a forecast URL
+def fetch_forecast(forecast_url):
+    """
+    Fetches the full forecast (unconditionally: the parser has just rewritten the property's Properties item,
+    so it no longer holds a previous copy) and returns it with its validators for later conditional requests.
+    Returns: FetchResult: status MODIFIED with the forecast JSON and its ETag / Last-Modified, or FAILED.
+    """
+    log_sampled(logger, "Forecast URL being used: %s", forecast_url)
+    with timer('forecast'):
+        result = fetch_json_conditional(forecast_url)
+    increment('forecast_fetches', status=result.status)
+    return result
+
+# Fetch weather data using latitude and longitude
+def fetch_weather_data(lat, lon):
+    """
+    Resolves the gridpoint forecast URL for the coordinates (from the shared points cache when nearby coordinates
+    were already looked up) and fetches its forecast.
+    Returns: tuple: (FetchResult, forecast URL), or (None, None) if either request fails.
+    """
+    log_sampled(logger, "Fetching weather for coordinates: Latitude = %s, Longitude = %s", lat, lon)
+
+    forecast_url = get_cached_forecast_url(get_dynamodb(), lat, lon)
+    if forecast_url:
+        log_sampled(logger, "Points cache hit for coordinates: %s,%s", lat, lon)
+        increment('points_cache_hits')
+        result = fetch_forecast(forecast_url)
+        if result.status == MODIFIED:
+            return result, forecast_url
+    else:
+        increment('points_cache_misses')
+
+    # Cache miss, or the cached gridpoint no longer serves a forecast
+    forecast_url = fetch_forecast_url(lat, lon)
+    if forecast_url:
+        store_forecast_url(get_dynamodb(), lat, lon, forecast_url)
+        result = fetch_forecast(forecast_url)
+        if result.status == MODIFIED:
+            return result, forecast_url
+    return None, None
+
 def parse_weather_data(weather_data):
     parsed_weather_data = {
         'temperature': weather_data['properties']['periods'][0]['temperature'],
@@ -103,124 +167,214 @@ def parse_weather_data(weather_data):
         'short_forecast': weather_data['properties']['periods'][0]['shortForecast']
     }
     detailed_forecast = weather_data['properties']['periods'][0]['detailedForecast']
-    print(f"Parsed weather data: {parsed_weather_data}")
-    print(f"Detailed forecast: {detailed_forecast}")
+    log_sampled(logger, "Parsed weather data: %s", parsed_weather_data)
+    log_sampled(logger, "Detailed forecast: %s", detailed_forecast)
 
     return parsed_weather_data, detailed_forecast
 
 # Save fetched weather data to DynamoDB
-def save_weather_data_to_dynamodb(property_id, weather_data, parsed_weather_data, detailed_forecast):
-    properties_table = dynamodb.Table('Properties')
-
-    weather_data = convert_floats_to_decimal(weather_data)
+def save_weather_data_to_dynamodb(property_id, forecast_url, weather_data, parsed_weather_data, detailed_forecast):
+    # The full forecast is stored once per gridpoint, the property only keeps its summary and a reference
+    gridpoint_id = gridpoint_id_from_url(forecast_url)
+    save_gridpoint_forecast(get_dynamodb(), forecast_url, weather_data, forecast_digest(weather_data))
 
-    try:
-        properties_table.update_item(
-            Key={'property_id': property_id},
-            UpdateExpression="SET weather_data = :weather_data, next_period_weather_data = :next_period_weather_data, next_period_forecast = :next_period_forecast",
-            ExpressionAttributeValues={
-                ':weather_data': weather_data,
-                ':next_period_weather_data': parsed_weather_data,
-                ':next_period_forecast': detailed_forecast
-            }
-        )
-        print(f"Weather data updated for property_id {property_id}")
-    except ClientError as e:
-        print(f"Error updating weather data for {property_id}: {e}")
-
-# Save forecast URL to WeatherLink table in DynamoDB
-def save_forecast_url_to_dynamodb(property_id, forecast_url):
-    weatherlink_table = dynamodb.Table('WeatherLink')
-    try:
-        weatherlink_table.put_item(
-            Item={
-                'property_id': property_id,
-                'forecast_url': forecast_url
-            }
-        )
-        print(f"Saved forecast URL for property_id {property_id}: {forecast_url}")
-    except ClientError as e:
-        print(f"Error saving forecast URL for {property_id}: {e}")
+    # The digest lets the scheduled updater skip rewriting this summary until its content changes
+    digest = content_digest([gridpoint_id, parsed_weather_data, detailed_forecast])
+    save_property_weather(get_dynamodb(), property_id, gridpoint_id, parsed_weather_data, detailed_forecast, digest, conditional=False)
 
 # Queue background task for fetching and saving weather data
 @app.task # Celery task decorator
 def queue_weather_job(property_id, parsed_address, run_id):
     task_start_time = time.time()
+    geocoding_api_time = 0
+    weather_api_time = 0
+    counts = defaultdict(int)
 
-    # Geocoding API call
-    geo_start_time = time.time()
-    lat, lon = fetch_lat_lon(parsed_address)
-    geo_end_time = time.time()
-    geocoding_api_time = geo_end_time - geo_start_time
+    # Use the forecast URL already stored for this property when it was resolved from the same address and still
+    # serves a forecast
+    weather_start_time = time.time()
+    weatherlink_item = get_weatherlink_item(property_id)
+    stored_forecast_url = stored_forecast_url_for(weatherlink_item, parsed_address)
+    result = fetch_forecast(stored_forecast_url) if stored_forecast_url else None
+    forecast_url = stored_forecast_url if result and result.status == MODIFIED else None
+    weather_api_time += time.time() - weather_start_time
 
-    if lat and lon:
-        # Weather API call
-        weather_start_time = time.time()
-        weather_data, forecast_url = fetch_weather_data(lat, lon)
-        weather_end_time = time.time()
-        weather_api_time = weather_end_time - weather_start_time
+    if not forecast_url:
+        # Geocoding API call
+        geo_start_time = time.time()
+        lat, lon = geocode_address(parsed_address, counts)
+        geo_end_time = time.time()
+        geocoding_api_time = geo_end_time - geo_start_time
+
+        if lat and lon:
+            # Weather API call
+            weather_start_time = time.time()
+            result, forecast_url = fetch_weather_data(lat, lon)
+            weather_end_time = time.time()
+            weather_api_time += weather_end_time - weather_start_time
+
+    succeeded = bool(result and forecast_url)
+    if succeeded:
+        weather_data = result.data
+        parsed_weather_data, detailed_forecast = parse_weather_data(weather_data)
+
+        # Save weather data to DynamoDB
+        save_weather_data_to_dynamodb(property_id, forecast_url, weather_data, parsed_weather_data, detailed_forecast)
+
+        # Save forecast URL, address and validators to WeatherLink table in DynamoDB (only when they changed)
+        geocode_key = geocode_cache_key(parsed_address) if parsed_address else None
+        stored_link = (stored_forecast_url, weatherlink_item.get('geocode_key'), weatherlink_item.get('etag'), weatherlink_item.get('last_modified'))
+        if (forecast_url, geocode_key, result.etag, result.last_modified) != stored_link:
+            put_weatherlink_item(property_id, forecast_url, result.etag, result.last_modified, geocode_key)
+
+    # The job's only statistics write: a record on its own key in the sharded RunStatisticsDetails table.
+    # Totals and averages are summed from these records when read, so workers never contend on the RunStatistics row
+    put_detail_record(get_dynamodb(), run_id, BACKGROUND_JOB_RECORD, property_id, build_background_job_record(
+        property_id, succeeded, counts, geocoding_api_time, weather_api_time, time.time() - task_start_time))
 
-        if weather_data and forecast_url:
-            api_sum_time = geocoding_api_time + weather_api_time
-            parsed_weather_data, detailed_forecast = parse_weather_data(weather_data)
 
-            # Save weather data to DynamoDB
-            save_weather_data_to_dynamodb(property_id, weather_data, parsed_weather_data, detailed_forecast)
-            
-            # Save forecast URL to WeatherLink table in DynamoDB
-            save_forecast_url_to_dynamodb(property_id, forecast_url)
+# Spread time spent on a shared lookup evenly over the properties that needed it
+def share_time(times, property_ids, seconds):
+    for property_id in property_ids:
+        times[property_id] += seconds / len(property_ids)
 
-            # Increment API success counter in DynamoDB
-            increment_api_success(run_id)
+# Fetch every forecast URL not fetched yet in this chunk once, concurrently over the pooled session
+def fetch_forecasts(property_ids_by_url, results, weather_api_times):
+    urls = [forecast_url for forecast_url in property_ids_by_url if forecast_url not in results]
+    if not urls:
+        return
+    start_time = time.time()
+    for forecast_url, result in iter_fetch_json(urls, fetch=fetch_forecast):
+        results[forecast_url] = result
+    share_time(weather_api_times, [property_id for url in urls for property_id in property_ids_by_url[url]], time.time() - start_time)
 
-            # Add background job details to DynamoDB
-            add_to_list(run_id, 'background_job_details', {
+# Queue background task for fetching and saving weather data for a chunk of properties
+@app.task
+def queue_weather_jobs_batch(jobs, run_id):
+    """
+    Batched variant of queue_weather_job: one message covers a whole chunk of properties, so the broker round trip,
+    result write are paid once per chunk. Inside the chunk every address is geocoded once, every rounded point
+    resolved once and every forecast URL fetched once (concurrently), and WeatherLink rows and the per-property
+    statistics records are read and written in batches.
+    Args: jobs (list): [property_id, parsed_address] pairs. run_id (str): The ID of the parser run.
+    Returns: dict: The number of properties in the chunk and how many got their weather saved.
+    """
+    task_start_time = time.time()
+    jobs = list(dict((property_id, parsed_address) for property_id, parsed_address in jobs).items())
+    geocoding_api_times = defaultdict(float)
+    weather_api_times = defaultdict(float)
+    counts = {property_id: defaultdict(int) for property_id, _ in jobs}
+    results = {}  # forecast URL -> FetchResult
+    forecast_urls = {}  # property_id -> forecast URL serving a forecast
+
+    # Use the forecast URLs already stored for these properties when they were resolved from the same address and
+    # still serve a forecast
+    weatherlink_items = get_weatherlink_items([property_id for property_id, _ in jobs])
+    property_ids_by_url = defaultdict(list)
+    for property_id, parsed_address in jobs:
+        stored_forecast_url = stored_forecast_url_for(weatherlink_items.get(property_id, {}), parsed_address)
+        if stored_forecast_url:
+            property_ids_by_url[stored_forecast_url].append(property_id)
+    fetch_forecasts(property_ids_by_url, results, weather_api_times)
+    for forecast_url, property_ids in property_ids_by_url.items():
+        if results[forecast_url].status == MODIFIED:
+            forecast_urls.update((property_id, forecast_url) for property_id in property_ids)
+
+    # Geocode the remaining properties, one lookup per unique address
+    property_ids_by_address = defaultdict(list)
+    for property_id, parsed_address in jobs:
+        if property_id not in forecast_urls:
+            property_ids_by_address[parsed_address].append(property_id)
+    property_ids_by_point = defaultdict(list)
+    coordinates_by_point = {}
+    for parsed_address, property_ids in property_ids_by_address.items():
+        geo_start_time = time.time()
+        lat, lon = geocode_address(parsed_address, counts[property_ids[0]])  # Counted once, on the first property
+        share_time(geocoding_api_times, property_ids, time.time() - geo_start_time)
+        if lat and lon:
+            point = points_cache_key(lat, lon)
+            coordinates_by_point.setdefault(point, (lat, lon))
+            property_ids_by_point[point].extend(property_ids)
+
+    # Resolve the gridpoint forecast URL once per rounded point, then fetch the URLs not fetched above
+    property_ids_by_url = defaultdict(list)
+    cached_points = {}  # forecast URL -> points whose URL came from the points cache
+    for point, property_ids in property_ids_by_point.items():
+        lat, lon = coordinates_by_point[point]
+        weather_start_time = time.time()
+        forecast_url = get_cached_forecast_url(get_dynamodb(), lat, lon)
+        if forecast_url:
+            log_sampled(logger, "Points cache hit for coordinates: %s,%s", lat, lon)
+            increment('points_cache_hits')
+            cached_points.setdefault(forecast_url, []).append(point)
+        else:
+            increment('points_cache_misses')
+            forecast_url = fetch_forecast_url(lat, lon)
+            if forecast_url:
+                store_forecast_url(get_dynamodb(), lat, lon, forecast_url)
+        share_time(weather_api_times, property_ids, time.time() - weather_start_time)
+        if forecast_url:
+            property_ids_by_url[forecast_url].extend(property_ids)
+    fetch_forecasts(property_ids_by_url, results, weather_api_times)
+    for forecast_url, property_ids in property_ids_by_url.items():
+        if results[forecast_url].status == MODIFIED:
+            forecast_urls.update((property_id, forecast_url) for property_id in property_ids)
+            continue
+        # The cached gridpoint no longer serves a forecast, so look the point up again
+        for point in cached_points.get(forecast_url, []):
+            lat, lon = coordinates_by_point[point]
+            weather_start_time = time.time()
+            fresh_forecast_url = fetch_forecast_url(lat, lon)
+            if fresh_forecast_url and fresh_forecast_url not in results:
+                store_forecast_url(get_dynamodb(), lat, lon, fresh_forecast_url)
+                results[fresh_forecast_url] = fetch_forecast(fresh_forecast_url)
+            share_time(weather_api_times, property_ids_by_point[point], time.time() - weather_start_time)
+            if fresh_forecast_url and results[fresh_forecast_url].status == MODIFIED:
+                forecast_urls.update((property_id, fresh_forecast_url) for property_id in property_ids_by_point[point])
+
+    # Save each gridpoint forecast once, then the weather summary of every property it covers
+    summaries = {}  # forecast URL -> (gridpoint_id, parsed_weather_data, detailed_forecast, digest)
+    weatherlink_writer = BatchWriter(get_dynamodb(), 'WeatherLink')
+    saved_property_ids = []
+    for property_id, parsed_address in jobs:
+        forecast_url = forecast_urls.get(property_id)
+        if not forecast_url:
+            log_sampled(logger, "No weather data saved for property_id %s", property_id)
+            continue
+        result = results[forecast_url]
+        if forecast_url not in summaries:
+            gridpoint_id = gridpoint_id_from_url(forecast_url)
+            save_gridpoint_forecast(get_dynamodb(), forecast_url, result.data, forecast_digest(result.data))
+            parsed_weather_data, detailed_forecast = parse_weather_data(result.data)
+            digest = content_digest([gridpoint_id, parsed_weather_data, detailed_forecast])
+            summaries[forecast_url] = (gridpoint_id, parsed_weather_data, detailed_forecast, digest)
+        gridpoint_id, parsed_weather_data, detailed_forecast, digest = summaries[forecast_url]
+        save_property_weather(get_dynamodb(), property_id, gridpoint_id, parsed_weather_data, detailed_forecast, digest, conditional=False)
+
+        # Save forecast URL, address and validators to WeatherLink table (only when they changed)
+        weatherlink_item = weatherlink_items.get(property_id, {})
+        geocode_key = geocode_cache_key(parsed_address) if parsed_address else None
+        stored_link = (weatherlink_item.get('forecast_url'), weatherlink_item.get('geocode_key'), weatherlink_item.get('etag'), weatherlink_item.get('last_modified'))
+        if (forecast_url, geocode_key, result.etag, result.last_modified) != stored_link:
+            weatherlink_writer.put({
                 'property_id': property_id,
-                'geocoding_api_time': str(geocoding_api_time),
-                'weather_api_time': str(weather_api_time),
-                'api_sum_time': str(api_sum_time)
+                'forecast_url': forecast_url,
+                'geocode_key': geocode_key,
+                'etag': result.etag,
+                'last_modified': result.last_modified
             })
 
-            # Atomic update of total background time, API times, and counts
-            statistics_table = dynamodb.Table('RunStatistics')
-            statistics_table.update_item(
-                Key={'run_id': run_id},
-                UpdateExpression="SET total_background_time = if_not_exists(total_background_time, :start) + :background_time, \
-                                  total_api_sum_time = if_not_exists(total_api_sum_time, :start) + :api_sum_time, \
-                                  total_geocoding_api_time = if_not_exists(total_geocoding_api_time, :start) + :geo_time, \
-                                  total_weather_api_time = if_not_exists(total_weather_api_time, :start) + :weather_time, \
-                                  background_api_calls_count = if_not_exists(background_api_calls_count, :start) + :inc",
-                ExpressionAttributeValues={
-                    ':background_time': Decimal(str(time.time() - task_start_time)),
-                    ':api_sum_time': Decimal(str(api_sum_time)),
-                    ':geo_time': Decimal(str(geocoding_api_time)),
-                    ':weather_time': Decimal(str(weather_api_time)),
-                    ':start': Decimal('0'),
-                    ':inc': 1
-                },
-                ReturnValues="UPDATED_NEW"  # Return updated values to use for averages
-            )
-
-            # Fetch updated totals after atomic increment
-            response = statistics_table.get_item(Key={'run_id': run_id})
-            if 'Item' in response:
-                total_background_time = Decimal(response['Item'].get('total_background_time', Decimal('0')))
-                background_api_calls_count = response['Item'].get('background_api_calls_count', 0)
-            else:
-                total_background_time = Decimal('0')
-                background_api_calls_count = 0
-
-            # Calculate averages
-            average_background_time = total_background_time / background_api_calls_count if background_api_calls_count > 0 else Decimal('0')
-            average_api_call_time = total_background_time / background_api_calls_count if background_api_calls_count > 0 else Decimal('0')
-
-            # Update the averages in DynamoDB
-            statistics_table.update_item(
-                Key={'run_id': run_id},
-                UpdateExpression="SET average_time_per_property_background = :avg_background_time, \
-                                  average_api_call_time = :avg_api_call_time",
-                ExpressionAttributeValues={
-                    ':avg_background_time': average_background_time,
-                    ':avg_api_call_time': average_api_call_time
-                }
-            )
+        saved_property_ids.append(property_id)
+    weatherlink_writer.flush()
+
+    # One statistics record per property, batch written; the chunk's run time is shared evenly between them
+    background_time = (time.time() - task_start_time) / len(jobs) if jobs else 0
+    saved = set(saved_property_ids)
+    with BatchWriter(get_dynamodb(), DETAILS_TABLE_NAME) as details_writer:
+        for property_id, _ in jobs:
+            details_writer.put(build_detail_item(run_id, BACKGROUND_JOB_RECORD, property_id, build_background_job_record(
+                property_id, property_id in saved, counts[property_id], geocoding_api_times[property_id],
+                weather_api_times[property_id], background_time)))
+
+    print(f"Weather saved for {len(saved_property_ids)} of {len(jobs)} properties in the chunk")
+    return {'properties': len(jobs), 'succeeded': len(saved_property_ids)}
@@ -0,0 +1,99 @@
+import random
+import time
+from botocore.exceptions import ClientError
+from instrumentation import timer
+
+# Largest number of requests DynamoDB accepts in a single BatchWriteItem call
+MAX_BATCH_SIZE = 25
+
+# Buffer DynamoDB writes and send them with BatchWriteItem
+class BatchWriter:
+    """
+    Collects put/delete requests for one table and writes them in BatchWriteItem calls of up to 25 requests.
+    Unprocessed items returned by DynamoDB are retried with jittered exponential backoff. Callers must not queue
+    two requests for the same key between flushes (DynamoDB rejects duplicate keys within a batch).
+
+    Args:
+        dynamodb: boto3 DynamoDB service resource.
+        table_name (str): Name of the table to write to.
+        batch_size (int): Number of requests to buffer before writing (capped at 25).
+        max_retries (int): Number of times to retry unprocessed items before giving up on them.
+        base_backoff (float): Initial backoff in seconds, doubled on every retry.
+        on_flush (callable): Optional callback receiving the list of put items (or delete keys) that were written.
+    """
+
+    def __init__(self, dynamodb, table_name, batch_size=MAX_BATCH_SIZE, max_retries=8, base_backoff=0.05, on_flush=None):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.on_flush = on_flush
+        self.pending = []
+        self.failed = []  # Requests that could not be written after all retries
+        self.items_written = 0
+        self.batch_calls = 0
+
+    def put(self, item):
+        self._add({'PutRequest': {'Item': item}})
+
+    def delete(self, key):
+        self._add({'DeleteRequest': {'Key': key}})
+
+    def _add(self, request):
+        self.pending.append(request)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every buffered request, retrying unprocessed items with backoff.
+        Returns: int: The number of requests written successfully.
+        """
+        written = 0
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            written += self._write_batch(batch)
+        return written
+
+    def _write_batch(self, batch):
+        requests = batch
+        attempt = 0
+        while requests:
+            try:
+                self.batch_calls += 1
+                with timer('dynamodb_write'):
+                    response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+            except ClientError as e:
+                print(f"Error writing batch to DynamoDB table {self.table_name}: {e}")
+                break
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                break
+            if attempt >= self.max_retries:
+                print(f"Giving up on {len(requests)} unprocessed items for DynamoDB table {self.table_name}")
+                break
+            # Full jitter exponential backoff before retrying the unprocessed items
+            time.sleep(random.uniform(0, self.base_backoff * (2 ** attempt)))
+            attempt += 1
+
+        # Anything still in 'requests' was not written
+        self.failed.extend(requests)
+        succeeded = [request for request in batch if request not in requests]
+        self.items_written += len(succeeded)
+
+        if self.on_flush and succeeded:
+            self.on_flush([self._payload(request) for request in succeeded])
+        return len(succeeded)
+
+    @staticmethod
+    def _payload(request):
+        if 'PutRequest' in request:
+            return request['PutRequest']['Item']
+        return request['DeleteRequest']['Key']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
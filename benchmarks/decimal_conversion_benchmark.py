@@ -0,0 +1,96 @@
+"""
+Micro-benchmark comparing the ways an NWS forecast payload can be turned into DynamoDB-ready data:
+json.loads followed by the original recursive convert_floats_to_decimal, json.loads followed by the iterative
+utilities.convert_floats_to_decimal_inplace, and decoding floats straight to Decimal with utilities.loads_decimal.
+
+Run from the repository root:
+    python -m benchmarks.decimal_conversion_benchmark [path/to/forecast.json ...] [--repeats N]
+"""
+import json
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from statistics import median
+from utilities import convert_floats_to_decimal_inplace, loads_decimal
+
+DEFAULT_FIXTURES = ['benchmarks/fixtures/nws_forecast.json', 'benchmarks/fixtures/nws_forecast_hourly.json']
+
+
+# The original conversion from utilities.py (recursive, rebuilds every dict and list)
+def legacy_convert_floats_to_decimal(obj):
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    elif isinstance(obj, dict):
+        return {k: legacy_convert_floats_to_decimal(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_convert_floats_to_decimal(i) for i in obj]
+    else:
+        return obj
+
+
+# Each strategy takes the raw response body and returns the DynamoDB-ready payload
+STRATEGIES = (
+    ('loads + recursive copy', lambda body: legacy_convert_floats_to_decimal(json.loads(body))),
+    ('loads + iterative in place', lambda body: convert_floats_to_decimal_inplace(json.loads(body))),
+    ('loads_decimal', loads_decimal),
+)
+
+
+# Time 'decode' over the body, returning the per-run timings in seconds (CPU time, so other processes don't skew it)
+def time_strategy(decode, body, repeats, iterations):
+    timings = []
+    for _ in range(repeats):
+        start = time.process_time()
+        for _ in range(iterations):
+            decode(body)
+        timings.append((time.process_time() - start) / iterations)
+    return timings
+
+
+# Total and peak traced allocation while decoding the body once
+def allocation(decode, body):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    payload = decode(body)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del payload
+    return current - start, peak - start
+
+
+def main(fixture_paths, repeats=20):
+    for fixture_path in fixture_paths:
+        with open(fixture_path, 'rb') as fixture_file:
+            body = fixture_file.read()
+        periods = len(json.loads(body)['properties']['periods'])
+        iterations = max(1, 2_000_000 // len(body))
+        print(f"{fixture_path}: {len(body) / 1024:.1f} KiB, {periods} periods ({repeats} repeats x {iterations} decodes)")
+
+        # Every strategy must produce the same payload before its timings mean anything
+        expected = STRATEGIES[0][1](body)
+        for label, decode in STRATEGIES[1:]:
+            if decode(body) != expected:
+                raise AssertionError(f"{label} produces a different payload than the recursive conversion")
+
+        results = {}
+        for label, decode in STRATEGIES:
+            timings = time_strategy(decode, body, repeats, iterations)
+            retained, peak = allocation(decode, body)
+            results[label] = median(timings)
+            print(f"{label:>26}: median {median(timings) * 1e6:9.1f} us, best {min(timings) * 1e6:9.1f} us, "
+                  f"retained {retained / 1024:7.1f} KiB, peak {peak / 1024:7.1f} KiB")
+        baseline = results[STRATEGIES[0][0]]
+        print("Speedup vs recursive copy: " + ", ".join(f"{label} {baseline / seconds:.2f}x" for label, seconds in list(results.items())[1:]))
+        print()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    repeats = 20
+    if '--repeats' in args:
+        index = args.index('--repeats')
+        repeats = int(args[index + 1])
+        del args[index:index + 2]
+    main(args or DEFAULT_FIXTURES, repeats)
@@ -0,0 +1,219 @@
+"""
+Synthetic MITS feed generator for scale testing xml_parser.py, using a real feed (abodo_feed.xml by default) as the
+template. Every generated <Property> is a copy of one of the template's properties with a new ID, a new street
+address in a city drawn from the city mix and, optionally, a different number of units. A share of the records can
+repeat an earlier property (duplicates) or be malformed. The feed is streamed to disk one <Property> at a time,
+so feeds of any size are generated in constant memory.
+
+Run from the repository root:
+    python -m benchmarks.feed_generator OUTPUT.xml [--count N] [--template abodo_feed.xml] [--seed N]
+        [--duplicate-rate RATE] [--city-mix "Madison=1,Forest Lake=2"] [--units MIN MAX]
+        [--malformed-rate RATE] [--malformed-kinds missing_id bad_bedrooms ...]
+"""
+import argparse
+import copy
+import random
+import re
+from collections import Counter
+from lxml import etree
+from feed_reader import iter_property_elements
+
+# Ways a record can be malformed (the document itself stays well-formed, only the record's content is broken)
+MALFORMED_KINDS = (
+    'missing_id',       # no <Identification> under <PropertyID>
+    'missing_city',     # no <City> in the property address
+    'missing_address',  # no <UnparsedAddress>
+    'bad_bedrooms',     # a unit's <UnitBedrooms> is not a number
+    'no_units',         # every <ILS_Unit> removed
+)
+
+# Most earlier properties kept as candidates for duplicates (only their generation parameters are kept)
+DUPLICATE_POOL_SIZE = 10000
+
+# First ID of the generated properties
+FIRST_PROPERTY_ID = 10000000
+
+STREET_PATTERN = re.compile(r'^\s*\d+\s+(.+?)\s*$')
+
+
+# The template feed's properties, cities and streets
+class FeedTemplate:
+    """
+    Args: template_path (str): The real feed to copy properties from.
+    """
+
+    def __init__(self, template_path):
+        self.properties = []
+        self.cities = Counter()  # City -> number of template properties in it
+        self.city_details = {}  # City -> (state, postal code)
+        streets = set()
+        for property_elem in iter_property_elements(template_path):
+            if property_elem.find('./PropertyID') is None:
+                continue
+            self.properties.append(copy.deepcopy(property_elem))
+            address = property_elem.find('./PropertyID/Address')
+            if address is None:
+                continue
+            city = address.findtext('City')
+            if city:
+                self.cities[city] += 1
+                self.city_details.setdefault(city, (address.findtext('State') or '', address.findtext('PostalCode') or ''))
+            street = STREET_PATTERN.match(address.findtext('AddressLine1') or '')
+            if street:
+                streets.add(street.group(1))
+        if not self.properties:
+            raise ValueError(f"No <Property> elements in template {template_path}")
+        self.streets = sorted(streets) or ['Main St']
+        self.nsmap, self.management = self._read_header(template_path)
+
+    # Root namespace declarations and <Management> block of the template, so generated feeds start like it
+    @staticmethod
+    def _read_header(template_path):
+        for _, elem in etree.iterparse(template_path, events=('end',), tag='Management', huge_tree=True):
+            return dict(elem.getparent().nsmap), copy.deepcopy(elem)
+        return {}, None
+
+
+# Parse a city mix ('Madison=1,Forest Lake=2') into city -> weight
+def parse_city_mix(spec):
+    city_mix = {}
+    for entry in spec.split(','):
+        city, _, weight = entry.partition('=')
+        city_mix[city.strip()] = float(weight) if weight else 1.0
+    return city_mix
+
+
+# Build one <Property> element from its generation parameters (the same parameters always give the same element)
+def build_property(template, params):
+    rng = random.Random(params['seed'])
+    property_elem = copy.deepcopy(template.properties[params['template']])
+    property_id = params['property_id']
+    city = params['city']
+    state, postal_code = template.city_details.get(city, ('', ''))
+    street_line = f"{params['street_number']} {params['street']}"
+
+    property_elem.set('IDValue', property_id)
+    property_id_elem = property_elem.find('./PropertyID')
+    identification = property_id_elem.find('Identification')
+    if identification is not None:
+        identification.set('IDValue', property_id)
+    name = property_id_elem.find('MarketingName')
+    if name is not None and name.text:
+        name.text = f"{name.text} {property_id}"
+
+    # The property's address and the addresses of its units all move to the new city
+    for address in property_elem.iter('Address'):
+        for tag, value in (('City', city), ('State', state), ('PostalCode', postal_code)):
+            field = address.find(tag)
+            if field is not None:
+                field.text = value
+    address = property_id_elem.find('Address')
+    if address is not None:
+        for tag, value in (('AddressLine1', street_line), ('UnparsedAddress', f"{street_line}\n{city}, {state} {postal_code}")):
+            field = address.find(tag)
+            if field is not None:
+                field.text = value
+
+    units = property_elem.findall('ILS_Unit')
+    if params['units'] is not None and units:
+        position = property_elem.index(units[0])
+        for unit in units:
+            property_elem.remove(unit)
+        for number in range(params['units']):
+            property_elem.insert(position + number, copy.deepcopy(units[number % len(units)]))
+
+    malformed = params.get('malformed')
+    if malformed == 'missing_id' and identification is not None:
+        property_id_elem.remove(identification)
+    elif malformed == 'missing_city' and address is not None and address.find('City') is not None:
+        address.remove(address.find('City'))
+    elif malformed == 'missing_address' and address is not None and address.find('UnparsedAddress') is not None:
+        address.remove(address.find('UnparsedAddress'))
+    elif malformed == 'bad_bedrooms':
+        bedrooms = property_elem.findall('./ILS_Unit/Units/Unit/UnitBedrooms')
+        if bedrooms:
+            rng.choice(bedrooms).text = rng.choice(['', 'studio', 'N/A', '2 BR'])
+    elif malformed == 'no_units':
+        for unit in property_elem.findall('ILS_Unit'):
+            property_elem.remove(unit)
+    return property_elem
+
+
+# Generate a synthetic feed, streaming it to 'output_path'
+def generate_feed(output_path, count, template_path='abodo_feed.xml', duplicate_rate=0.0, city_mix=None, units=None,
+                  malformed_rate=0.0, malformed_kinds=MALFORMED_KINDS, seed=0):
+    """
+    Args:
+        output_path (str): Where to write the feed.
+        count (int): Number of <Property> records, duplicates and malformed records included.
+        template_path (str): The real feed used as the template.
+        duplicate_rate (float): Share of records repeating an earlier property (same ID and content).
+        city_mix (dict): City -> weight of the generated properties (defaults to the template's own mix).
+        units (tuple): (min, max) number of <ILS_Unit> per property (defaults to the template property's units).
+        malformed_rate (float): Share of new records broken in one of 'malformed_kinds'.
+        seed (int): Random seed (the same arguments and seed generate the same feed).
+    Returns: dict: Counts of what was written ('properties', 'unique', 'duplicates', 'malformed' and 'cities').
+    """
+    template = FeedTemplate(template_path)
+    rng = random.Random(seed)
+    cities, weights = zip(*(city_mix or template.cities).items())
+    duplicate_pool = []
+    malformed = Counter()
+    written_cities = Counter()
+    duplicates = 0
+
+    with etree.xmlfile(output_path, encoding='UTF-8') as feed:
+        feed.write_declaration()
+        with feed.element('PhysicalProperty', nsmap=template.nsmap):
+            if template.management is not None:
+                feed.write('\n', template.management)
+            for index in range(count):
+                if duplicate_pool and rng.random() < duplicate_rate:
+                    params = rng.choice(duplicate_pool)
+                    duplicates += 1
+                else:
+                    params = {
+                        'seed': rng.getrandbits(32),
+                        'template': rng.randrange(len(template.properties)),
+                        'property_id': str(FIRST_PROPERTY_ID + index),
+                        'city': rng.choices(cities, weights)[0],
+                        'street_number': rng.randint(1, 29999),
+                        'street': rng.choice(template.streets),
+                        'units': rng.randint(*units) if units else None
+                    }
+                    if malformed_kinds and rng.random() < malformed_rate:
+                        params['malformed'] = rng.choice(malformed_kinds)
+                        malformed[params['malformed']] += 1
+                    if len(duplicate_pool) < DUPLICATE_POOL_SIZE:
+                        duplicate_pool.append(params)
+                    else:
+                        duplicate_pool[rng.randrange(DUPLICATE_POOL_SIZE)] = params
+                written_cities[params['city']] += 1
+                feed.write('\n', build_property(template, params))
+            feed.write('\n')
+
+    return {
+        'properties': count,
+        'unique': count - duplicates,
+        'duplicates': duplicates,
+        'malformed': dict(malformed),
+        'cities': dict(written_cities)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic MITS feed from a real one")
+    parser.add_argument('output', help="path of the feed to write")
+    parser.add_argument('--count', type=int, default=100000, help="number of <Property> records")
+    parser.add_argument('--template', default='abodo_feed.xml', help="real feed used as the template")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help="share of records repeating an earlier property")
+    parser.add_argument('--city-mix', type=parse_city_mix, help="e.g. 'Madison=1,Forest Lake=2' (default: the template's mix)")
+    parser.add_argument('--units', type=int, nargs=2, metavar=('MIN', 'MAX'), help="units per property (default: the template's)")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="share of records with broken content")
+    parser.add_argument('--malformed-kinds', nargs='+', choices=MALFORMED_KINDS, default=list(MALFORMED_KINDS))
+    args = parser.parse_args()
+    summary = generate_feed(args.output, args.count, args.template, args.duplicate_rate, args.city_mix, args.units,
+                            args.malformed_rate, tuple(args.malformed_kinds), args.seed)
+    print(f"Wrote {summary['properties']} properties to {args.output} ({summary['unique']} unique, "
+          f"{summary['duplicates']} duplicates, malformed: {summary['malformed']}, cities: {summary['cities']})")
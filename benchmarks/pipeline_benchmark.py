@@ -0,0 +1,226 @@
+"""
+End-to-end benchmark of the ingestion pipeline: parses a feed generated from abodo_feed.xml by
+benchmarks.feed_generator ('scale' times as many properties as the template) with xml_parser.py, runs the weather
+tasks it queues, then two scheduled refreshes of every WeatherLink row (one after the stub publishes new forecasts,
+one answered with 304s). Everything runs in process:
+- DynamoDB is moto's in-memory mock (or a scratch DynamoDB Local / moto server passed with --dynamodb-endpoint,
+  whose pipeline tables are dropped and recreated at every scale),
+- Celery tasks are executed eagerly, so neither a broker nor workers are needed,
+- Nominatim and api.weather.gov are replaced by benchmarks.stub_api. The stub's host has no rate limit budget,
+  so the shared Redis token buckets are never touched.
+
+For every scale and stage it reports the items processed, throughput, latency percentiles and peak traced memory,
+followed by the pipeline's own hot-path stage histograms (instrumentation.py) for that scale.
+
+Run from the repository root:
+    python -m benchmarks.pipeline_benchmark [--scales 1 10 100] [--feed abodo_feed.xml] [--api-latency SECONDS]
+                                            [--parse-mode stream|tree|parallel] [--dynamodb-endpoint URL] [--json PATH]
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+from benchmarks.feed_generator import FeedTemplate, generate_feed
+from benchmarks.stub_api import StubApi
+
+# Tables the pipeline creates, dropped before every scale so each one starts empty
+PIPELINE_TABLES = ('Properties', 'WeatherLink', 'RunStatistics', 'RunStatisticsDetails', 'GeocodeCache',
+                   'PointsCache', 'GridpointForecasts', 'Weather')
+
+
+# Value at the given percentile of the samples (nearest rank, None without samples)
+def percentile(samples, percent):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))]
+
+
+# Run one stage with the pipeline's own output silenced, measuring time and peak traced memory
+def run_stage(name, work):
+    """
+    Args: name (str): Stage name. work (callable): Runs the stage and returns (items processed, latency samples).
+    Returns: dict: The stage's measurements.
+    """
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        items, latencies = work()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        'stage': name,
+        'items': items,
+        'seconds': seconds,
+        'throughput': items / seconds if seconds else 0.0,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'peak_mib': (peak - baseline) / (1024 * 1024)
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else float(seconds) * 1000
+
+
+# Print the pipeline's own stage histograms (calls, p50, p99 and total seconds per instrumented stage)
+def print_stage_histograms():
+    from instrumentation import STAGES, get_histogram
+    for stage in STAGES:
+        histogram = get_histogram('stage_seconds', stage=stage)
+        if histogram.count:
+            print(f"{'':>7}{stage:<15} {histogram.count:>8} calls, p50 {_ms(histogram.percentile(50)):9.3f} ms, "
+                  f"p99 {_ms(histogram.percentile(99)):9.3f} ms, total {histogram.sum:8.2f} s")
+
+
+def print_stage(scale, result):
+    latencies = ' '.join(f"{result[key]:9.2f}" if result[key] is not None else f"{'-':>9}" for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+    print(f"{scale:>5}x {result['stage']:<24} {result['items']:>8} {result['seconds']:9.2f} {result['throughput']:10.1f} "
+          f"{latencies} {result['peak_mib']:9.1f}")
+
+
+# Benchmark the pipeline on one scaled feed
+def benchmark_scale(scale, feed_path, stub, parse_mode):
+    # Imported here: the pipeline modules read their configuration from the environment set up by main()
+    import xml_parser
+    import background_tasks
+    import scheduled_weather_updater
+    from data_access import get_dynamodb, get_run_statistics
+    from run_statistics import get_detail_records, BACKGROUND_JOB_RECORD
+
+    dynamodb = get_dynamodb()
+    existing_tables = set(dynamodb.meta.client.list_tables()['TableNames'])
+    for table_name in PIPELINE_TABLES:
+        if table_name in existing_tables:
+            dynamodb.Table(table_name).delete()
+            dynamodb.meta.client.get_waiter('table_not_exists').wait(TableName=table_name)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        xml_parser.ensure_tables()  # Table creation isn't part of the parse stage
+
+    xml_parser.XML_FEED_PATH = feed_path
+    xml_parser.XML_PARSE_MODE = parse_mode
+    results = []
+
+    # Parse: the weather task messages are recorded instead of sent, and run in the next stage
+    messages = []
+    run = {}
+
+    def parse():
+        tasks = (background_tasks.queue_weather_job, background_tasks.queue_weather_jobs_batch)
+        for task in tasks:
+            task.delay = lambda *args, task=task: messages.append((task, args))
+        try:
+            run['run_id'] = xml_parser.main()
+        finally:
+            for task in tasks:
+                del task.delay
+        runtimes = get_detail_records(dynamodb, run['run_id'], record_type='property_runtime')
+        return int(get_run_statistics(run['run_id'], include_background=False)['total_properties_in_xml']), [record['parser_runtime'] for record in runtimes]
+    results.append(run_stage('parse', parse))
+
+    # Weather jobs: every recorded message executed eagerly, latency per property from the jobs' own records
+    def weather_jobs():
+        for task, args in messages:
+            task.apply(args=args)
+        records = get_detail_records(dynamodb, run['run_id'], record_type=BACKGROUND_JOB_RECORD)
+        return len(records), [record['background_time'] for record in records]
+    results.append(run_stage('weather jobs', weather_jobs))
+
+    # Scheduled refreshes of every WeatherLink row, segment by segment (latency per segment task)
+    def refresh():
+        total_segments = scheduled_weather_updater.REFRESH_SCAN_SEGMENTS
+        rows, latencies = 0, []
+        for segment in range(total_segments):
+            start = time.perf_counter()
+            stats = scheduled_weather_updater.refresh_weatherlink_segment.apply(args=(segment, total_segments)).get()
+            latencies.append(time.perf_counter() - start)
+            rows += (stats or {}).get('properties', 0)
+        return rows, latencies
+
+    stub.bump_forecasts()
+    results.append(run_stage('refresh (new forecasts)', refresh))
+    results.append(run_stage('refresh (not modified)', refresh))
+    return results
+
+
+def main(args):
+    # The stub has to be up before the pipeline modules are imported, since they read the API URLs on import
+    stub = StubApi(latency=args.api_latency)
+    base_url = stub.start()
+    os.environ['NOMINATIM_URL'] = base_url
+    os.environ['WEATHER_API_URL'] = base_url
+    os.environ.setdefault('STATS_FLUSH_INTERVAL', '0')
+    os.environ.setdefault('METRICS_PORT', '0')  # The histograms are printed instead of served
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')  # Sampled per-property log lines go to stderr, which isn't silenced
+
+    mock = None
+    if args.dynamodb_endpoint:
+        os.environ['DYNAMODB_ENDPOINT_URL'] = args.dynamodb_endpoint
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise SystemExit("moto is not installed: pip install moto, or pass --dynamodb-endpoint of a scratch DynamoDB Local")
+        os.environ['DYNAMODB_ENDPOINT_URL'] = ''
+        os.environ['DYNAMODB_REGION'] = 'us-east-1'
+        mock = mock_aws()
+        mock.start()
+
+    import background_tasks
+    import scheduled_weather_updater
+    from instrumentation import reset_metrics
+    for celery_app in (background_tasks.app, scheduled_weather_updater.app):
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_store_eager_result = False
+
+    # Feeds hold 'scale' times as many properties as the template, generated with the template's own city mix
+    template_size = len(FeedTemplate(args.feed).properties)
+    work_dir = tempfile.mkdtemp(prefix='pipeline-benchmark-')
+    all_results = []
+    tracemalloc.start()
+    try:
+        print(f"Feed template: {args.feed}, parse mode: {args.parse_mode}, API latency: {args.api_latency * 1000:.0f} ms, "
+              f"DynamoDB: {args.dynamodb_endpoint or 'moto (in process)'}")
+        print(f"{'scale':>6} {'stage':<24} {'items':>8} {'seconds':>9} {'items/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'peak MiB':>9}")
+        for scale in args.scales:
+            feed_path = os.path.join(work_dir, f"feed_{scale}x.xml")
+            generate_feed(feed_path, scale * template_size, args.feed, seed=scale)
+            stub.requests.clear()
+            reset_metrics()
+            for result in benchmark_scale(scale, feed_path, stub, args.parse_mode):
+                print_stage(scale, result)
+                all_results.append(dict(result, scale=scale))
+            print(f"{'':>7}stub API requests: {dict(sorted(stub.requests.items()))}")
+            print_stage_histograms()
+            os.remove(feed_path)
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        stub.stop()
+        if mock:
+            mock.stop()
+
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(all_results, json_file, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against local stand-ins")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help="copies of the feed template to benchmark")
+    parser.add_argument('--feed', default='abodo_feed.xml', help="feed used as the template")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds added to every stub API response")
+    parser.add_argument('--parse-mode', default='stream', choices=('stream', 'tree', 'parallel'))
+    parser.add_argument('--dynamodb-endpoint', help="scratch DynamoDB Local / moto server instead of moto in process")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    main(parser.parse_args())
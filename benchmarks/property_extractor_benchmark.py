@@ -0,0 +1,85 @@
+"""
+Micro-benchmark comparing the per-property XPath calls the parser used to make against
+property_extractor.extract_property.
+
+Run from the repository root:
+    python -m benchmarks.property_extractor_benchmark [path/to/feed.xml] [repeats]
+"""
+import sys
+import time
+import tracemalloc
+from statistics import median
+from lxml import etree
+from property_extractor import extract_property
+from utilities import parse_address
+
+
+# The original per-property code path from xml_parser.py (one XPath evaluation per field, ID looked up twice)
+def legacy_extract(property_elem):
+    property_id = property_elem.xpath('./PropertyID/Identification/@IDValue')[0]
+    city_elem = property_elem.xpath('./PropertyID/Address/City')
+    bedrooms = sum([int(float(unit.find('./UnitBedrooms').text))
+                    for ils_unit in property_elem.findall('.//ILS_Unit')
+                    for units in ils_unit.findall('./Units')
+                    for unit in units.findall('./Unit')])
+    property_id = property_elem.xpath('./PropertyID/Identification/@IDValue')
+    marketing_name = property_elem.xpath('./PropertyID/MarketingName')
+    email = property_elem.xpath('./PropertyID/Email')
+    unparsed_address = property_elem.xpath('./PropertyID/Address/UnparsedAddress')[0].text
+    return {
+        'property_id': property_id[0] if property_id else None,
+        'city': city_elem[0].text if city_elem else None,
+        'name': marketing_name[0].text if marketing_name else None,
+        'email': email[0].text if email else None,
+        'unparsed_address': unparsed_address,
+        'parsed_address': parse_address(unparsed_address),
+        'bedrooms': bedrooms
+    }
+
+
+# Time 'extract' over every property element, returning the per-run timings in seconds
+def time_extractor(extract, property_elems, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for property_elem in property_elems:
+            extract(property_elem)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# Peak traced allocation while extracting (and holding on to) a record for every property
+def peak_allocation(extract, property_elems):
+    tracemalloc.start()
+    records = [extract(property_elem) for property_elem in property_elems]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return peak
+
+
+def main(xml_path='abodo_feed.xml', repeats=50):
+    property_elems = etree.parse(xml_path).getroot().findall('.//Property')
+    count = len(property_elems)
+    print(f"Benchmarking {count} properties from '{xml_path}' ({repeats} repeats)")
+
+    # Both code paths must agree before their timings mean anything
+    for property_elem in property_elems:
+        expected = legacy_extract(property_elem)
+        record = extract_property(property_elem)
+        mismatched = [field for field, value in expected.items() if getattr(record, field) != value]
+        if mismatched:
+            raise AssertionError(f"extract_property differs from the legacy path on {mismatched} for {expected['property_id']}")
+
+    results = {}
+    for label, extract in (('legacy xpath', legacy_extract), ('extract_property', extract_property)):
+        timings = time_extractor(extract, property_elems, repeats)
+        results[label] = median(timings)
+        print(f"{label:>18}: median {median(timings) / count * 1e6:8.1f} us/property, "
+              f"best {min(timings) / count * 1e6:8.1f} us/property, "
+              f"peak allocations {peak_allocation(extract, property_elems) / 1024:8.1f} KiB")
+    print(f"Speedup: {results['legacy xpath'] / results['extract_property']:.2f}x")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'abodo_feed.xml', int(sys.argv[2]) if len(sys.argv) > 2 else 50)
@@ -0,0 +1,134 @@
+"""
+Local stand-in for the Nominatim and api.weather.gov endpoints the weather tasks call, used by the benchmarks.
+
+Addresses geocode to deterministic coordinates spread around Madison, coordinates resolve to one of ~100 gridpoints
+and every gridpoint serves the NWS forecast fixture. Forecasts carry an ETag, so conditional requests get a 304
+until bump_forecasts() publishes a new version.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_FORECAST_FIXTURE = 'benchmarks/fixtures/nws_forecast.json'
+
+
+# Stub API server running on a background thread
+class StubApi:
+    """
+    Args:
+        latency (float): Seconds every response is delayed by, to mimic the real APIs' round trips.
+        forecast_fixture (str): NWS forecast JSON served for every gridpoint.
+    """
+
+    def __init__(self, latency=0.0, forecast_fixture=DEFAULT_FORECAST_FIXTURE):
+        self.latency = latency
+        with open(forecast_fixture, 'rb') as fixture_file:
+            self.forecast = json.load(fixture_file)
+        self.version = 1
+        self.forecast_body = self._encode_forecast()
+        self.requests = Counter()  # Route -> number of requests served
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        """
+        Returns: str: The base URL to use for both NOMINATIM_URL and WEATHER_API_URL.
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def bump_forecasts(self):
+        """
+        Publishes a new forecast version (new ETag, updateTime and temperatures) for every gridpoint.
+        """
+        with self.lock:
+            self.version += 1
+            self.forecast_body = self._encode_forecast()
+
+    def _encode_forecast(self):
+        forecast = json.loads(json.dumps(self.forecast))
+        properties = forecast['properties']
+        properties['updateTime'] = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+        for period in properties['periods']:
+            period['temperature'] += self.version - 1
+        return json.dumps(forecast).encode('utf-8')
+
+    # Deterministic coordinates for an address, within ~0.2 degrees of Madison
+    @staticmethod
+    def coordinates(address):
+        digest = int(hashlib.sha1(address.encode('utf-8')).hexdigest()[:8], 16)
+        return f"{43.0 + (digest % 2000) / 10000:.7f}", f"{-89.5 + (digest // 2000 % 2000) / 10000:.7f}"
+
+    # Gridpoint covering the coordinates (about a 10 x 10 grid over the area addresses geocode to)
+    @staticmethod
+    def gridpoint(lat, lon):
+        return f"MKX/{int((float(lat) - 43.0) * 50)},{int((float(lon) + 89.5) * 50)}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the real APIs
+
+    def do_GET(self):
+        api = self.server.api
+        if api.latency:
+            time.sleep(api.latency)
+        url = urlsplit(self.path)
+
+        if url.path == '/search':
+            route = 'search'
+            lat, lon = api.coordinates(parse_qs(url.query).get('q', [''])[0])
+            self._send_json([{'lat': lat, 'lon': lon}])
+        elif url.path.startswith('/points/'):
+            route = 'points'
+            lat, lon = url.path[len('/points/'):].split(',')
+            self._send_json({'properties': {'forecast': f"{api.base_url}/gridpoints/{api.gridpoint(lat, lon)}/forecast"}})
+        elif url.path.startswith('/gridpoints/') and url.path.endswith('/forecast'):
+            with api.lock:
+                body, etag = api.forecast_body, f'"v{api.version}"'
+            if self.headers.get('If-None-Match') == etag:
+                route = 'forecast (304)'
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                route = 'forecast'
+                self._send_body(body, {'ETag': etag})
+        else:
+            route = 'not found'
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        with api.lock:
+            api.requests[route] += 1
+
+    def _send_json(self, value):
+        self._send_body(json.dumps(value).encode('utf-8'), {})
+
+    def _send_body(self, body, headers):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
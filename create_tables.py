@@ -1,22 +1,26 @@
-import boto3
 from botocore.exceptions import ClientError
+from data_access import get_dynamodb
 
-# Connect to DynamoDB
-dynamodb = boto3.resource('dynamodb',
-                          endpoint_url='http://localhost:8000',
-                          region_name='dummy',
-                          aws_access_key_id='dummy',
-                          aws_secret_access_key='dummy'
-                          )
+# Index of WeatherLink rows by forecast URL, used to refresh the properties of one gridpoint
+WEATHERLINK_FORECAST_URL_INDEX = {
+    'IndexName': 'forecast_url-index',
+    'KeySchema': [{'AttributeName': 'forecast_url', 'KeyType': 'HASH'}],
+    'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['etag', 'last_modified']},
+    'ProvisionedThroughput': {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 10}
+}
 
 # Create DynamoDB WeatherLink table from scratch
 def create_weatherlink_table():
     try:
         print("Creating DynamoDB table 'WeatherLink'...")
-        dynamodb.create_table(
+        get_dynamodb().create_table(
             TableName='WeatherLink',
             KeySchema=[{'AttributeName': 'property_id', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'property_id', 'AttributeType': 'S'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'property_id', 'AttributeType': 'S'},
+                {'AttributeName': 'forecast_url', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[WEATHERLINK_FORECAST_URL_INDEX],
             ProvisionedThroughput={
                 'ReadCapacityUnits': 10,
                 'WriteCapacityUnits': 10
@@ -26,14 +30,30 @@ def create_weatherlink_table():
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceInUseException':
             print("DynamoDB WeatherLink table already exists.")
+            ensure_weatherlink_forecast_url_index()
         else:
             print(f"Unexpected error: {e}")
 
+# Add the forecast URL index to a WeatherLink table created before it existed
+def ensure_weatherlink_forecast_url_index():
+    description = get_dynamodb().meta.client.describe_table(TableName='WeatherLink')['Table']
+    if any(index['IndexName'] == WEATHERLINK_FORECAST_URL_INDEX['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])):
+        return
+    try:
+        print("Adding forecast URL index to DynamoDB WeatherLink table...")
+        get_dynamodb().meta.client.update_table(
+            TableName='WeatherLink',
+            AttributeDefinitions=[{'AttributeName': 'forecast_url', 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{'Create': WEATHERLINK_FORECAST_URL_INDEX}]
+        )
+    except ClientError as e:
+        print(f"Could not add forecast URL index to WeatherLink: {e}")
+
 # Create DynamoDB WeatherLink table from scratch
 def create_statistics_table():
     try:
         print("Creating DynamoDB table 'RunStatistics'...")
-        dynamodb.create_table(
+        get_dynamodb().create_table(
             TableName='RunStatistics',
             KeySchema=[{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
             AttributeDefinitions=[{'AttributeName': 'run_id', 'AttributeType': 'S'}],
@@ -46,11 +66,99 @@ def create_statistics_table():
         else:
             print(f"Unexpected error: {e}")
 
+# Create DynamoDB RunStatisticsDetails table (per-property records, partitioned by '<run_id>#<shard>')
+def create_statistics_details_table():
+    try:
+        print("Creating DynamoDB table 'RunStatisticsDetails'...")
+        get_dynamodb().create_table(
+            TableName='RunStatisticsDetails',
+            KeySchema=[
+                {'AttributeName': 'run_shard', 'KeyType': 'HASH'},
+                {'AttributeName': 'record_id', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'run_shard', 'AttributeType': 'S'},
+                {'AttributeName': 'record_id', 'AttributeType': 'S'}
+            ],
+            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 10}
+        )
+        print("DynamoDB RunStatisticsDetails table created successfully.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("DynamoDB RunStatisticsDetails table already exists.")
+        else:
+            print(f"Unexpected error: {e}")
+
+# Create DynamoDB GeocodeCache table (address -> coordinates, expired through the 'expires_at' TTL attribute)
+def create_geocode_cache_table():
+    try:
+        print("Creating DynamoDB table 'GeocodeCache'...")
+        get_dynamodb().create_table(
+            TableName='GeocodeCache',
+            KeySchema=[{'AttributeName': 'address', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'address', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5}
+        )
+        get_dynamodb().meta.client.get_waiter('table_exists').wait(TableName='GeocodeCache')
+        enable_time_to_live('GeocodeCache', 'expires_at')
+        print("DynamoDB GeocodeCache table created successfully.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("DynamoDB GeocodeCache table already exists.")
+        else:
+            print(f"Unexpected error: {e}")
+
+# Create DynamoDB PointsCache table (rounded 'lat,lon' -> forecast URL of the covering NWS gridpoint)
+def create_points_cache_table():
+    try:
+        print("Creating DynamoDB table 'PointsCache'...")
+        get_dynamodb().create_table(
+            TableName='PointsCache',
+            KeySchema=[{'AttributeName': 'point', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'point', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5}
+        )
+        get_dynamodb().meta.client.get_waiter('table_exists').wait(TableName='PointsCache')
+        enable_time_to_live('PointsCache', 'expires_at')
+        print("DynamoDB PointsCache table created successfully.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("DynamoDB PointsCache table already exists.")
+        else:
+            print(f"Unexpected error: {e}")
+
+# Create DynamoDB GridpointForecasts table (one compact forecast per NWS gridpoint, referenced by Properties items)
+def create_gridpoint_forecasts_table():
+    try:
+        print("Creating DynamoDB table 'GridpointForecasts'...")
+        get_dynamodb().create_table(
+            TableName='GridpointForecasts',
+            KeySchema=[{'AttributeName': 'gridpoint_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'gridpoint_id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5}
+        )
+        print("DynamoDB GridpointForecasts table created successfully.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("DynamoDB GridpointForecasts table already exists.")
+        else:
+            print(f"Unexpected error: {e}")
+
+# Turn on TTL expiry for a table
+def enable_time_to_live(table_name, attribute_name):
+    try:
+        get_dynamodb().meta.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute_name}
+        )
+    except ClientError as e:
+        print(f"Could not enable TTL on {table_name}: {e}")
+
 
 # Function to create DynamoDB table if it doesn't exist
 def create_properties_table():
     try:
-        dynamodb.create_table(
+        get_dynamodb().create_table(
             TableName='Properties',
             KeySchema=[
                 {'AttributeName': 'property_id', 'KeyType': 'HASH'}
@@ -70,6 +178,55 @@ def create_properties_table():
         else:
             print(f"Unexpected error: {e}")
 
+# Create DynamoDB Weather table (forecast periods per NWS gridpoint, sorted by start time and expired through the
+# 'expires_at' TTL attribute once they are over)
+def create_weather_table():
+    try:
+        print("Creating DynamoDB table 'Weather'...")
+        get_dynamodb().create_table(
+            TableName='Weather',
+            KeySchema=[
+                {'AttributeName': 'gridpoint_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'period_start', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'gridpoint_id', 'AttributeType': 'S'},
+                {'AttributeName': 'period_start', 'AttributeType': 'S'}
+            ],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 10,
+                'WriteCapacityUnits': 10
+            }
+        )
+        get_dynamodb().meta.client.get_waiter('table_exists').wait(TableName='Weather')
+        enable_time_to_live('Weather', 'expires_at')
+        print("DynamoDB Weather table created successfully.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("DynamoDB Weather table already exists.")
+            if migrate_weather_table():
+                create_weather_table()
+        else:
+            print(f"Unexpected error: {e}")
+
+# Delete a Weather table created by older versions (keyed on 'period_number'), whose key every period write of the
+# gridpoint forecasts would fail on. Its periods are rewritten by the next refresh of each gridpoint
+def migrate_weather_table():
+    """
+    Returns: bool: True if the old table was deleted and the Weather table needs to be created again.
+    """
+    key_schema = get_dynamodb().meta.client.describe_table(TableName='Weather')['Table']['KeySchema']
+    if [key['AttributeName'] for key in key_schema] == ['gridpoint_id', 'period_start']:
+        return False
+    try:
+        print("Deleting DynamoDB Weather table keyed on 'period_number', to recreate it per gridpoint...")
+        get_dynamodb().meta.client.delete_table(TableName='Weather')
+        get_dynamodb().meta.client.get_waiter('table_not_exists').wait(TableName='Weather')
+        return True
+    except ClientError as e:
+        print(f"Could not delete the old Weather table: {e}")
+        return False
+
 
 # To delete and recreate the RunStatistics table on each run, uncomment the following code and delete the 'create_statistics_table' code above
 '''
@@ -77,8 +234,8 @@ def create_properties_table():
 def reset_statistics_table():
     try:
         print("Deleting DynamoDB table 'RunStatistics' if it exists...")
-        dynamodb.Table('RunStatistics').delete()
-        table_waiter = dynamodb.meta.client.get_waiter('table_not_exists')
+        get_dynamodb().Table('RunStatistics').delete()
+        table_waiter = get_dynamodb().meta.client.get_waiter('table_not_exists')
         table_waiter.wait(TableName='RunStatistics')
         print("DynamoDB table 'RunStatistics' deleted.")
     except ClientError as e:
@@ -92,13 +249,13 @@ def reset_statistics_table():
 def create_statistics_table():
     try:
         print("Creating DynamoDB table 'RunStatistics'...")
-        dynamodb.create_table(
+        get_dynamodb().create_table(
             TableName='RunStatistics',
             KeySchema=[{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
             AttributeDefinitions=[{'AttributeName': 'run_id', 'AttributeType': 'S'}],
             ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
         )
-        table_waiter = dynamodb.meta.client.get_waiter('table_exists')
+        table_waiter = get_dynamodb().meta.client.get_waiter('table_exists')
         table_waiter.wait(TableName='RunStatistics')
         print("DynamoDB table 'RunStatistics' created successfully.")
     except ClientError as e:
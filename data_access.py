@@ -0,0 +1,217 @@
+import os
+import random
+import threading
+import time
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from weather_store import get_upcoming_periods
+from run_statistics import summarize_background_jobs, DEFAULT_DETAIL_SHARDS
+from instrumentation import get_logger, log_sampled
+
+# DynamoDB connection (the local DynamoDB container by default, an empty endpoint uses the region's AWS endpoint)
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL', 'http://localhost:8000') or None
+DYNAMODB_REGION = os.environ.get('DYNAMODB_REGION', 'dummy')
+DYNAMODB_ACCESS_KEY_ID = os.environ.get('DYNAMODB_ACCESS_KEY_ID', 'dummy')
+DYNAMODB_SECRET_ACCESS_KEY = os.environ.get('DYNAMODB_SECRET_ACCESS_KEY', 'dummy')
+
+# HTTP connections each thread's DynamoDB client keeps open, retry attempts ('standard' mode backs off with jitter
+# on throttling) and timeouts in seconds
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '50'))
+DYNAMODB_MAX_ATTEMPTS = int(os.environ.get('DYNAMODB_MAX_ATTEMPTS', '5'))
+DYNAMODB_RETRY_MODE = os.environ.get('DYNAMODB_RETRY_MODE', 'standard')
+DYNAMODB_CONNECT_TIMEOUT = float(os.environ.get('DYNAMODB_CONNECT_TIMEOUT', '5'))
+DYNAMODB_READ_TIMEOUT = float(os.environ.get('DYNAMODB_READ_TIMEOUT', '10'))
+
+_dynamodb_config = Config(
+    max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+    retries={'max_attempts': DYNAMODB_MAX_ATTEMPTS, 'mode': DYNAMODB_RETRY_MODE},
+    connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+    read_timeout=DYNAMODB_READ_TIMEOUT
+)
+
+logger = get_logger('data_access')
+
+_local = threading.local()  # This thread's DynamoDB resource, and the process it was created in
+_lock = threading.Lock()
+
+# Get this thread's DynamoDB service resource
+def get_dynamodb():
+    """
+    boto3 resources (and sessions) aren't thread-safe, so every thread gets its own, built from its own session with
+    the shared pool / retry / timeout configuration. Created on first use rather than at import time, so importing a
+    module that talks to DynamoDB costs nothing, and rebuilt after a fork, so every Celery worker process gets its
+    own connections.
+    Returns: boto3 DynamoDB service resource of the calling thread (don't hand it to other threads).
+    """
+    dynamodb = getattr(_local, 'dynamodb', None)
+    if dynamodb is None or _local.pid != os.getpid():
+        # Building sessions concurrently can race in botocore's loaders, so threads build theirs one at a time
+        with _lock:
+            session = boto3.session.Session()
+            dynamodb = session.resource('dynamodb',
+                                        endpoint_url=DYNAMODB_ENDPOINT_URL,
+                                        region_name=DYNAMODB_REGION,
+                                        aws_access_key_id=DYNAMODB_ACCESS_KEY_ID,
+                                        aws_secret_access_key=DYNAMODB_SECRET_ACCESS_KEY,
+                                        config=_dynamodb_config
+                                        )
+        _local.dynamodb = dynamodb
+        _local.pid = os.getpid()
+    return dynamodb
+
+# Get a table of this thread's DynamoDB resource
+def get_table(table_name):
+    return get_dynamodb().Table(table_name)
+
+
+# Read every item of a scan or query, following LastEvaluatedKey past the 1 MB page limit
+def _read_all_pages(operation, **kwargs):
+    items = []
+    while True:
+        response = operation(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+# Properties table
+
+# Get a property's item (None if it doesn't exist or can't be read)
+def get_property(property_id):
+    try:
+        return get_table('Properties').get_item(Key={'property_id': property_id}).get('Item')
+    except ClientError as e:
+        print(f"Error reading property {property_id}: {e}")
+        return None
+
+# Read every item of the Properties table
+def scan_properties(projection=None):
+    """
+    Args: projection (str): Optional ProjectionExpression limiting the attributes read.
+    Returns: list: The Properties items.
+    """
+    scan_kwargs = {'ProjectionExpression': projection} if projection else {}
+    return _read_all_pages(get_table('Properties').scan, **scan_kwargs)
+
+
+# WeatherLink table
+
+# Get the WeatherLink row stored for a property (empty dict if there isn't one)
+def get_weatherlink_item(property_id):
+    try:
+        response = get_table('WeatherLink').get_item(Key={'property_id': property_id})
+    except ClientError as e:
+        print(f"Error reading forecast URL for {property_id}: {e}")
+        return {}
+    return response.get('Item', {})
+
+# Read the WeatherLink rows of many properties with BatchGetItem (property_id -> row, missing properties left out)
+def get_weatherlink_items(property_ids, max_retries=8, base_backoff=0.05):
+    keys = [{'property_id': property_id} for property_id in dict.fromkeys(property_ids)]
+    items = {}
+    for start in range(0, len(keys), 100):  # BatchGetItem accepts at most 100 keys per call
+        request_items = {'WeatherLink': {'Keys': keys[start:start + 100]}}
+        attempt = 0
+        while request_items:
+            try:
+                response = get_dynamodb().batch_get_item(RequestItems=request_items)
+            except ClientError as e:
+                print(f"Error reading forecast URLs: {e}")
+                break
+            for item in response.get('Responses', {}).get('WeatherLink', []):
+                items[item['property_id']] = item
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                if attempt >= max_retries:
+                    print(f"Giving up on {len(request_items['WeatherLink']['Keys'])} unprocessed forecast URL reads")
+                    break
+                time.sleep(random.uniform(0, base_backoff * (2 ** attempt)))
+                attempt += 1
+    return items
+
+# Save a property's forecast URL, the geocode key of the address it was resolved from and the validators of the
+# forecast it holds
+def put_weatherlink_item(property_id, forecast_url, etag=None, last_modified=None, geocode_key=None):
+    try:
+        get_table('WeatherLink').put_item(
+            Item={
+                'property_id': property_id,
+                'forecast_url': forecast_url,
+                'geocode_key': geocode_key,
+                'etag': etag,
+                'last_modified': last_modified
+            }
+        )
+        log_sampled(logger, "Saved forecast URL for property_id %s: %s", property_id, forecast_url)
+    except ClientError as e:
+        print(f"Error saving forecast URL for {property_id}: {e}")
+
+# Store the validators of the forecast a property now holds on its WeatherLink row
+def update_weatherlink_validators(property_id, etag, last_modified):
+    try:
+        get_table('WeatherLink').update_item(
+            Key={'property_id': property_id},
+            UpdateExpression="SET etag = :etag, last_modified = :last_modified",
+            ExpressionAttributeValues={':etag': etag, ':last_modified': last_modified}
+        )
+    except ClientError as e:
+        print(f"Error saving forecast validators for {property_id}: {e}")
+
+# Remove a property's WeatherLink row
+def delete_weatherlink_item(property_id):
+    try:
+        get_table('WeatherLink').delete_item(Key={'property_id': property_id})
+    except ClientError as e:
+        print(f"Error removing forecast URL for property {property_id}: {e}")
+
+# Read every WeatherLink row in one segment of a parallel scan
+def scan_weatherlink_segment(segment, total_segments):
+    return _read_all_pages(get_table('WeatherLink').scan,
+                           Segment=segment,
+                           TotalSegments=total_segments,
+                           ProjectionExpression='property_id, forecast_url, etag, last_modified')
+
+# Read the WeatherLink rows using a forecast URL (through the forecast URL index)
+def query_weatherlink_rows(forecast_url):
+    return _read_all_pages(get_table('WeatherLink').query,
+                           IndexName='forecast_url-index',
+                           KeyConditionExpression=Key('forecast_url').eq(forecast_url))
+
+
+# RunStatistics table
+
+# Create the RunStatistics row of a run
+def put_run_statistics(item):
+    get_table('RunStatistics').put_item(Item=item)
+
+# Get the RunStatistics row of a run (None if it doesn't exist)
+def get_run_statistics(run_id, include_background=True):
+    """
+    Weather jobs never write to the RunStatistics row, so the background totals and averages
+    ('successful_api_calls', 'average_time_per_property_background', 'average_api_call_time', ...) are derived from
+    the jobs' detail records at read time, as of the jobs finished so far.
+    Args: run_id (str): The run. include_background (bool): Derive the background totals (skipping them saves a query
+          per detail shard).
+    Returns: dict: The row, with the derived background fields.
+    """
+    item = get_table('RunStatistics').get_item(Key={'run_id': run_id}).get('Item')
+    if item and include_background:
+        item.update(summarize_background_jobs(get_dynamodb(), run_id, int(item.get('detail_shards', DEFAULT_DETAIL_SHARDS))))
+    return item
+
+
+# Weather table (periods per gridpoint, written with each new gridpoint forecast, see weather_store)
+
+# Read the next forecast periods for a property (empty list if it has no weather yet)
+def get_property_upcoming_periods(property_id, limit=14):
+    """
+    Args: property_id (str): The property. limit (int): Most periods to return.
+    Returns: list: Weather items of the property's gridpoint, starting with the period in progress.
+    """
+    item = get_property(property_id)
+    if not item or not item.get('gridpoint_id'):
+        return []
+    return get_upcoming_periods(get_dynamodb(), item['gridpoint_id'], limit)
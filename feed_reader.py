@@ -0,0 +1,133 @@
+import mmap
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+from property_extractor import extract_property
+
+# Parser for the byte ranges of <Property> elements handed to worker processes
+CHUNK_PARSER = etree.XMLParser(huge_tree=True)
+
+# Patterns used to carry the XML declaration and root namespace declarations over to each byte range
+XML_DECLARATION_PATTERN = re.compile(rb'<\?xml[^>]*\?>')
+ROOT_TAG_PATTERN = re.compile(rb'<(?![?!])[^>]*>')
+NAMESPACE_PATTERN = re.compile(rb'xmlns(?::[\w.-]+)?\s*=\s*(?:"[^"]*"|\'[^\']*\')')
+
+# Stream <Property> elements from the XML feed one at a time
+def iter_property_elements(xml_path, tag='Property'):
+    """
+    Incrementally parses the XML feed with lxml's iterparse and yields each <Property> element once it is complete.
+    After the caller is done with an element it is cleared, along with any earlier siblings still attached to the
+    root, so memory use stays flat no matter how large the feed is.
+    Args: xml_path (str): Path to the XML feed. tag (str): Element tag to yield.
+    Yields: lxml.etree._Element: A fully parsed <Property> element (only valid until the next iteration).
+    """
+    context = etree.iterparse(xml_path, events=('end',), tag=tag, huge_tree=True)
+    try:
+        for _, elem in context:
+            yield elem
+
+            # Free the processed element and the siblings that came before it
+            elem.clear(keep_tail=True)
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+    finally:
+        del context
+
+
+# Find the byte offset of the next <Property> start tag at or after 'position' (-1 if there is none)
+def _find_property_start(data, position):
+    while True:
+        position = data.find(b'<Property', position)
+        if position < 0 or data[position + 9:position + 10] in (b' ', b'>', b'\t', b'\n', b'\r', b'/'):
+            return position
+        position += 9
+
+# Split the feed into byte ranges that each hold a run of complete <Property> elements
+def split_property_ranges(xml_path, chunk_bytes):
+    """
+    Cuts the feed into ranges of roughly 'chunk_bytes' bytes, each starting at a <Property> start tag and ending
+    right before the next range, so every range is a well-formed sequence of <Property> siblings. Assumes the
+    <Property> elements are children of the document root, as in MITS feeds.
+    Args: xml_path (str): Path to the XML feed. chunk_bytes (int): Target size of each range.
+    Returns: tuple: (list of (start, end) byte offsets, prefix bytes the worker wraps each range in).
+    """
+    if os.path.getsize(xml_path) == 0:
+        return [], b''
+    with open(xml_path, 'rb') as feed_file, mmap.mmap(feed_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        first = _find_property_start(data, 0)
+        last_close = data.rfind(b'</Property>')
+        if first < 0 or last_close < first:
+            return [], b''
+        end = last_close + len(b'</Property>')
+
+        ranges = []
+        start = first
+        while start < end:
+            next_start = _find_property_start(data, start + chunk_bytes) if start + chunk_bytes < end else -1
+            if next_start < 0 or next_start >= end:
+                ranges.append((start, end))
+                break
+            ranges.append((start, next_start))
+            start = next_start
+
+        # Each range is parsed inside a wrapper element carrying the document's encoding and namespace declarations
+        head = bytes(data[:first])
+    declaration = XML_DECLARATION_PATTERN.search(head)
+    root_tag = ROOT_TAG_PATTERN.search(head)
+    namespaces = b' '.join(NAMESPACE_PATTERN.findall(root_tag.group(0))) if root_tag else b''
+    prefix = (declaration.group(0) if declaration else b'') + b'<PropertyChunk ' + namespaces + b'>'
+    return ranges, prefix
+
+# Extract the fields of every <Property> in a byte range of the feed (runs in a worker process)
+def extract_property_range(xml_path, start, end, prefix):
+    with open(xml_path, 'rb') as feed_file:
+        feed_file.seek(start)
+        fragment = feed_file.read(end - start)
+    chunk_root = etree.fromstring(prefix + fragment + b'</PropertyChunk>', parser=CHUNK_PARSER)
+    return [extract_property(property_elem) for property_elem in chunk_root.iterchildren('Property')]
+
+# Yield extracted property records from the feed, in document order
+def iter_property_records(xml_path, mode='stream', workers=None, chunk_bytes=8 * 1024 * 1024):
+    """
+    Extracts the fields of every <Property> in the feed.
+    Args:
+        xml_path (str): Path to the XML feed.
+        mode (str): 'tree' loads the whole document, 'stream' uses iterparse, 'parallel' splits the file into byte
+                    ranges of whole <Property> elements that are parsed across a pool of worker processes.
+        workers (int): Number of worker processes for 'parallel' mode (defaults to the number of CPUs).
+        chunk_bytes (int): Target size in bytes of each range handed to a worker in 'parallel' mode.
+    Yields: PropertyRecord: The extracted fields of each property, in the order the properties appear in the feed.
+    """
+    if mode == 'tree':
+        root = etree.parse(xml_path).getroot()
+        for property_elem in root.findall('.//Property'):
+            yield extract_property(property_elem)
+    elif mode == 'parallel':
+        yield from _iter_property_records_parallel(xml_path, workers or os.cpu_count() or 1, chunk_bytes)
+    else:
+        for property_elem in iter_property_elements(xml_path):
+            yield extract_property(property_elem)
+
+def _iter_property_records_parallel(xml_path, workers, chunk_bytes):
+    ranges, prefix = split_property_ranges(xml_path, chunk_bytes)
+
+    # Fork where available: under 'spawn' the workers would re-import the calling script
+    start_methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context('fork') if 'fork' in start_methods else None
+
+    # Limit the ranges in flight so finished results don't pile up in memory
+    max_in_flight = workers * 2
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        for start, end in ranges:
+            in_flight.append(executor.submit(extract_property_range, xml_path, start, end, prefix))
+            # Results are yielded in range order, so merging stays deterministic
+            while len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
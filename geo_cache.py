@@ -0,0 +1,90 @@
+import os
+import time
+from botocore.exceptions import ClientError
+
+# DynamoDB table caching geocoding results, keyed on the normalized parse_address output
+GEOCODE_CACHE_TABLE = 'GeocodeCache'
+
+# How long found coordinates and "address not found" results are cached for (seconds)
+GEOCODE_CACHE_TTL = int(os.environ.get('GEOCODE_CACHE_TTL', str(90 * 24 * 60 * 60)))
+GEOCODE_NEGATIVE_CACHE_TTL = int(os.environ.get('GEOCODE_NEGATIVE_CACHE_TTL', str(24 * 60 * 60)))
+
+# Normalize a parsed address into a cache key
+def geocode_cache_key(parsed_address):
+    """
+    Builds the cache key for an address that has already gone through parse_address.
+    Args: parsed_address (str): The parsed address ('+' separated alphanumeric words).
+    Returns: str: The lower-cased address with empty words removed.
+    """
+    return '+'.join(word for word in parsed_address.lower().split('+') if word)
+
+# Look up cached coordinates for an address
+def get_cached_coordinates(dynamodb, parsed_address):
+    """
+    Returns: tuple: (hit, lat, lon). 'hit' is True for both cached coordinates and cached "not found" results
+    (in which case lat and lon are None). Expired entries are treated as misses.
+    """
+    try:
+        response = dynamodb.Table(GEOCODE_CACHE_TABLE).get_item(Key={'address': geocode_cache_key(parsed_address)})
+    except ClientError as e:
+        print(f"Error reading geocode cache for {parsed_address}: {e}")
+        return False, None, None
+
+    item = response.get('Item')
+    # DynamoDB TTL deletes lazily, so the expiry is checked here as well
+    if not item or int(item.get('expires_at', 0)) <= time.time():
+        return False, None, None
+    if not item.get('found'):
+        return True, None, None
+    return True, item['lat'], item['lon']
+
+# Store coordinates (or a "not found" result when lat/lon are None) for an address
+def store_coordinates(dynamodb, parsed_address, lat, lon):
+    found = bool(lat and lon)
+    item = {
+        'address': geocode_cache_key(parsed_address),
+        'found': found,
+        'expires_at': int(time.time()) + (GEOCODE_CACHE_TTL if found else GEOCODE_NEGATIVE_CACHE_TTL)
+    }
+    if found:
+        item.update({'lat': lat, 'lon': lon})
+    try:
+        dynamodb.Table(GEOCODE_CACHE_TABLE).put_item(Item=item)
+    except ClientError as e:
+        print(f"Error saving geocode cache entry for {parsed_address}: {e}")
+
+
+# DynamoDB table caching api.weather.gov /points lookups, keyed on rounded coordinates
+POINTS_CACHE_TABLE = 'PointsCache'
+
+# Decimal places coordinates are rounded to (2 places is ~1 km, well inside a 2.5 km NWS grid cell) and cache lifetime
+POINTS_CACHE_PRECISION = int(os.environ.get('POINTS_CACHE_PRECISION', '2'))
+POINTS_CACHE_TTL = int(os.environ.get('POINTS_CACHE_TTL', str(30 * 24 * 60 * 60)))
+
+# Round coordinates into a points cache key so nearby properties share one entry
+def points_cache_key(lat, lon):
+    return f"{round(float(lat), POINTS_CACHE_PRECISION):.{POINTS_CACHE_PRECISION}f},{round(float(lon), POINTS_CACHE_PRECISION):.{POINTS_CACHE_PRECISION}f}"
+
+# Look up the cached forecast URL for the gridpoint covering the given coordinates (None on a miss)
+def get_cached_forecast_url(dynamodb, lat, lon):
+    try:
+        response = dynamodb.Table(POINTS_CACHE_TABLE).get_item(Key={'point': points_cache_key(lat, lon)})
+    except ClientError as e:
+        print(f"Error reading points cache for {lat},{lon}: {e}")
+        return None
+
+    item = response.get('Item')
+    if not item or int(item.get('expires_at', 0)) <= time.time():
+        return None
+    return item['forecast_url']
+
+# Store the forecast URL resolved for the given coordinates
+def store_forecast_url(dynamodb, lat, lon, forecast_url):
+    try:
+        dynamodb.Table(POINTS_CACHE_TABLE).put_item(Item={
+            'point': points_cache_key(lat, lon),
+            'forecast_url': forecast_url,
+            'expires_at': int(time.time()) + POINTS_CACHE_TTL
+        })
+    except ClientError as e:
+        print(f"Error saving points cache entry for {lat},{lon}: {e}")
@@ -0,0 +1,158 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from utilities import loads_decimal
+from rate_limiter import get_rate_limiter
+
+# Maximum number of requests in flight at once, and the per-host connection pool size
+FETCH_CONCURRENCY = int(os.environ.get('FETCH_CONCURRENCY', '16'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', str(FETCH_CONCURRENCY)))
+
+# Seconds to wait for a connection / for a response before giving up on a request
+HTTP_TIMEOUT = (float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5')), float(os.environ.get('HTTP_READ_TIMEOUT', '15')))
+
+# Retries for rate limited (429 / 503) responses and connection errors, with jittered exponential backoff capped at
+# HTTP_MAX_BACKOFF seconds (a Retry-After header from the server takes precedence)
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '4'))
+HTTP_BASE_BACKOFF = float(os.environ.get('HTTP_BASE_BACKOFF', '0.5'))
+HTTP_MAX_BACKOFF = float(os.environ.get('HTTP_MAX_BACKOFF', '60'))
+RETRY_STATUS_CODES = (429, 503)
+
+# Outcome of a conditional fetch: status is MODIFIED (data holds the decoded JSON, with non-integer numbers as Decimal),
+# NOT_MODIFIED (304) or FAILED
+FetchResult = namedtuple('FetchResult', ['status', 'data', 'etag', 'last_modified'])
+MODIFIED = 'modified'
+NOT_MODIFIED = 'not_modified'
+FAILED = 'failed'
+
+_session = None
+_executor = None
+_lock = threading.Lock()
+
+# Get the process-wide pooled HTTP session (created on first use, so forked Celery workers each build their own)
+def get_session():
+    """
+    Returns a requests.Session whose connection pools keep up to HTTP_POOL_SIZE keep-alive connections per host,
+    so repeated requests to api.weather.gov reuse TLS connections instead of opening a new one each time.
+    The session only sends plain GETs without cookies, so it is shared by the fetch threads.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+# Get the process-wide thread pool used for concurrent fetches
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix='http-fetch')
+    return _executor
+
+# Seconds to wait according to a Retry-After header (delay in seconds or an HTTP date), None if absent or invalid
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Backoff before retry number 'attempt' (full jitter, so workers that failed together don't retry together)
+def retry_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, HTTP_MAX_BACKOFF) + random.uniform(0, HTTP_BASE_BACKOFF)
+    return random.uniform(0, min(HTTP_MAX_BACKOFF, HTTP_BASE_BACKOFF * (2 ** attempt)))
+
+# Send a GET within the host's shared rate limit, retrying rate limited responses and connection errors
+def http_get(url, headers=None, timeout=HTTP_TIMEOUT):
+    """
+    Takes a token from the host's rate limiter bucket before every attempt. On a 429 or 503 the Retry-After delay
+    (or a jittered exponential backoff) is applied to the shared bucket, so every worker holds off, not only this one.
+    Returns: requests.Response: The final response (still 429 / 503 when the retries ran out).
+    Raises: requests.exceptions.RequestException: When the request still fails after HTTP_MAX_RETRIES retries.
+    """
+    limiter = get_rate_limiter()
+    attempt = 0
+    while True:
+        limiter.acquire(url)
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= HTTP_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt)
+            print(f"Request to {url} failed with error: {e}, retrying in {delay:.1f}s")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= HTTP_MAX_RETRIES:
+                return response
+            delay = retry_delay(attempt, parse_retry_after(response.headers.get('Retry-After')))
+            print(f"Request to {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            limiter.pause(url, delay)
+        time.sleep(delay)
+        attempt += 1
+
+# Fetch a URL with a conditional GET when validators from a previous response are known
+def fetch_json_conditional(url, etag=None, last_modified=None, headers=None):
+    """
+    Sends If-None-Match / If-Modified-Since for the given validators so an unchanged resource comes back as an
+    empty 304 instead of the full body.
+    Args: url (str): URL to fetch. etag (str): ETag of the copy we hold. last_modified (str): Its Last-Modified value.
+    Returns: FetchResult: The status, decoded JSON (MODIFIED only) and the validators to store for the next request.
+    """
+    request_headers = dict(headers or {})
+    if etag:
+        request_headers['If-None-Match'] = etag
+    if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
+    try:
+        response = http_get(url, headers=request_headers)
+    except requests.exceptions.RequestException as e:
+        print(f"Request to {url} failed with error: {e}")
+        return FetchResult(FAILED, None, etag, last_modified)
+
+    if response.status_code == 304:
+        return FetchResult(NOT_MODIFIED, None, response.headers.get('ETag', etag), response.headers.get('Last-Modified', last_modified))
+    if response.status_code != 200:
+        print(f"Failed to fetch {url}, status code: {response.status_code}")
+        return FetchResult(FAILED, None, etag, last_modified)
+    try:
+        # Floats are decoded straight to Decimal, so payloads can be written to DynamoDB without a conversion pass
+        data = loads_decimal(response.content)
+    except ValueError as e:
+        print(f"Invalid JSON from {url}: {e}")
+        return FetchResult(FAILED, None, etag, last_modified)
+    return FetchResult(MODIFIED, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+# Fetch a URL and decode its JSON body (None on any failure)
+def fetch_json(url, headers=None):
+    return fetch_json_conditional(url, headers=headers).data
+
+# Fetch many URLs concurrently, yielding results as they arrive
+def iter_fetch_json(urls, fetch=fetch_json):
+    """
+    Runs 'fetch' for every URL on the shared thread pool (at most FETCH_CONCURRENCY at a time) over the pooled session.
+    Args: urls (iterable): URLs to fetch. fetch (callable): Function taking a URL and returning its result.
+    Yields: tuple: (url, result) in completion order, so callers can process a response while others are in flight.
+    """
+    executor = get_executor()
+    futures = {executor.submit(fetch, url): url for url in urls}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
@@ -0,0 +1,222 @@
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Hot-path stages timed into the pipeline_stage_seconds histogram
+STAGES = ('parse', 'dynamodb_write', 'geocode', 'points', 'forecast', 'stats_flush')
+
+# Local OpenMetrics endpoint: the parser serves it on METRICS_PORT, Celery worker processes on the first free port
+# from WORKER_METRICS_PORT on (WORKER_METRICS_PORTS ports are tried, one per worker process). A port of 0 disables it
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9464'))
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', '9465'))
+WORKER_METRICS_PORTS = int(os.environ.get('WORKER_METRICS_PORTS', '64'))
+METRICS_PREFIX = 'pipeline'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Log level of the pipeline loggers, and how many per-property messages of each kind share one INFO line
+# (the others are logged at DEBUG, so they cost nothing unless LOG_LEVEL=DEBUG)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_EVERY = max(1, int(os.environ.get('LOG_SAMPLE_EVERY', '100')))
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Histogram bucket upper bounds, log-linear like an HDR histogram: 10 buckets per decade from 1 microsecond to
+# ~1000 seconds, so any recorded value is within ~13% of its bucket's bounds
+HISTOGRAM_BOUNDS = tuple(float(f"{10 ** (exponent / 10):.3g}") for exponent in range(-60, 31))
+
+_histograms = {}  # (name, labels) -> Histogram
+_counters = defaultdict(int)  # (name, labels) -> count
+_registry_lock = threading.Lock()
+_sample_counts = defaultdict(itertools.count)  # Message -> running count, for sampled logging
+_metrics_server = None
+
+
+# Fixed-bucket histogram of durations (seconds), safe to record into from any thread
+class Histogram:
+    """
+    Args: bounds (tuple): Sorted bucket upper bounds. Values above the last bound land in an overflow (+Inf) bucket.
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Returns: float: Upper bound of the bucket holding the value at the given percentile (nearest rank), capped at
+                 the largest recorded value (None if nothing was recorded).
+        """
+        with self.lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if not count:
+            return None
+        rank = max(1, round(percent / 100 * count))
+        for index, cumulative in enumerate(itertools.accumulate(counts)):
+            if cumulative >= rank:
+                return min(self.bounds[index], largest) if index < len(self.bounds) else largest
+        return largest
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+
+# Get the histogram for a metric name and labels (created on first use)
+def get_histogram(name, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    return histogram
+
+# Add to a counter
+def increment(name, amount=1, **labels):
+    with _registry_lock:
+        _counters[(name, tuple(sorted(labels.items())))] += amount
+
+# Time the enclosed block into the stage's histogram (failed attempts are timed too)
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_histogram('stage_seconds', stage=stage).record(time.perf_counter() - start)
+
+# Yield the items of an iterable, timing how long each one took to produce into the stage's histogram
+def timed_iter(stage, iterable):
+    histogram = get_histogram('stage_seconds', stage=stage)
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        histogram.record(time.perf_counter() - start)
+        yield item
+
+# Forget every recorded value (used between benchmark runs)
+def reset_metrics():
+    with _registry_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+# Render every metric of this process in the OpenMetrics text format
+def render_openmetrics():
+    with _registry_lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    families = set()
+    for (name, labels), histogram in histograms:
+        family = f"{METRICS_PREFIX}_{name}"
+        if family not in families:
+            families.add(family)
+            lines.append(f"# TYPE {family} histogram")
+            lines.append(f"# UNIT {family} seconds")
+            lines.append(f"# HELP {family} Time spent per call, by pipeline stage.")
+        counts, count, total = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.bounds, counts):
+            cumulative += bucket_count
+            lines.append(f"{family}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+        lines.append(f"{family}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{family}_count{_format_labels(labels)} {count}")
+        lines.append(f"{family}_sum{_format_labels(labels)} {total!r}")
+    for (name, labels), value in counters:
+        family = f"{METRICS_PREFIX}_{name}"
+        if family not in families:
+            families.add(family)
+            lines.append(f"# TYPE {family} counter")
+        lines.append(f"{family}_total{_format_labels(labels)} {value}")
+    lines.append("# EOF")
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = render_openmetrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Serve /metrics on a background thread, on the first free port of 'attempts' ports from 'port' (once per process)
+def start_metrics_server(port=METRICS_PORT, attempts=1, host=METRICS_HOST):
+    """
+    Returns: ThreadingHTTPServer: The running server, or None when metrics are disabled (port 0) or no port was free.
+    """
+    global _metrics_server
+    if _metrics_server is not None or not port:
+        return _metrics_server
+    for candidate in range(port, port + max(1, attempts)):
+        try:
+            server = ThreadingHTTPServer((host, candidate), _MetricsHandler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        _metrics_server = server
+        get_logger('instrumentation').info("Serving metrics at http://%s:%d/metrics", host, candidate)
+        return server
+    get_logger('instrumentation').warning("No free port for the metrics endpoint in %d-%d", port, port + max(1, attempts) - 1)
+    return None
+
+# Serve the metrics of a Celery worker process (connected to the worker_process_init signal by the Celery apps)
+def start_worker_metrics_server(**kwargs):
+    return start_metrics_server(WORKER_METRICS_PORT, attempts=WORKER_METRICS_PORTS)
+
+
+# Logger of a pipeline module ('pipeline.<name>'), at LOG_LEVEL
+def get_logger(name):
+    logging.getLogger(METRICS_PREFIX).setLevel(LOG_LEVEL)
+    return logging.getLogger(f"{METRICS_PREFIX}.{name}")
+
+# Send pipeline log records to stderr when the process hasn't configured logging itself (Celery workers have)
+def configure_logging():
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.getLogger(METRICS_PREFIX).setLevel(LOG_LEVEL)
+
+# Log a per-property message: one in every LOG_SAMPLE_EVERY of each message at INFO, the rest at DEBUG
+def log_sampled(logger, message, *args):
+    if next(_sample_counts[message]) % LOG_SAMPLE_EVERY == 0:
+        logger.info(message, *args)
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, *args)
@@ -0,0 +1,150 @@
+import cProfile
+import inspect
+import io
+import os
+import pstats
+import random
+import re
+import time
+import tracemalloc
+
+# Profiling mode of the parser and the Celery tasks: '' (off), 'cpu' (cProfile), 'memory' (tracemalloc) or 'all'.
+# The parser also takes it as --profile
+PROFILE_MODES = ('cpu', 'memory', 'all')
+PROFILE_MODE = os.environ.get('PROFILE_MODE', '').lower()
+
+# Where profile artifacts are written, and how many hotspots the summaries list
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '20'))
+
+# Share of Celery task executions that are profiled, and the tasks eligible (comma separated task function names,
+# e.g. 'queue_weather_jobs_batch,refresh_weatherlink_segment'; empty for all)
+PROFILE_TASK_SAMPLE_RATE = float(os.environ.get('PROFILE_TASK_SAMPLE_RATE', '0.1'))
+PROFILE_TASKS = {name.strip() for name in os.environ.get('PROFILE_TASKS', '').split(',') if name.strip()}
+
+# Frames kept per allocation traceback (more frames make snapshots larger but let them be grouped by 'traceback')
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', '5'))
+
+_task_profilers = {}  # Task ID -> (Profiler, run_id) of the task executions being profiled
+
+
+# cProfile and/or tracemalloc around a block of work, saved as per-run artifacts with a hotspot summary
+class Profiler:
+    """
+    Args: mode (str): 'cpu', 'memory' or 'all'. top_n (int): Number of hotspots printed in the summaries.
+          profile_dir (str): Directory the artifacts are written to.
+    """
+
+    def __init__(self, mode, top_n=PROFILE_TOP_N, profile_dir=PROFILE_DIR):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.top_n = top_n
+        self.profile_dir = profile_dir
+        self.cpu_profile = cProfile.Profile() if mode in ('cpu', 'all') else None
+        self.trace_memory = mode in ('memory', 'all')
+        self.started_tracemalloc = False
+        self.start_time = None
+
+    def start(self):
+        # tracemalloc is process wide: a caller already tracing (a benchmark, an overlapping task) keeps its session
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        if self.cpu_profile:
+            self.cpu_profile.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self, tag):
+        """
+        Stops profiling and writes '<tag>.pstats' (cProfile stats, loadable with pstats or snakeviz) and
+        '<tag>.tracemalloc' (an allocation snapshot, loadable with tracemalloc.Snapshot.load), then prints the
+        top hotspots.
+        Args: tag (str): Name of the artifacts, e.g. '<run_id>-parser'.
+        Returns: list: Paths of the artifacts written.
+        """
+        elapsed = time.perf_counter() - self.start_time
+        if self.cpu_profile:
+            self.cpu_profile.disable()
+        snapshot = peak = None
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base_path = os.path.join(self.profile_dir, re.sub(r'[^\w.-]+', '_', tag))
+        paths = []
+        summary = [f"Profile {tag} ({self.mode}, {elapsed:.2f}s)"]
+        if self.cpu_profile:
+            paths.append(f"{base_path}.pstats")
+            self.cpu_profile.dump_stats(paths[-1])
+            summary.append(cpu_hotspots(self.cpu_profile, self.top_n))
+        if snapshot is not None:
+            paths.append(f"{base_path}.tracemalloc")
+            snapshot.dump(paths[-1])
+            if self.started_tracemalloc:
+                summary.append(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB")
+            summary.append(memory_hotspots(snapshot, self.top_n))
+        summary.append(f"Profile artifacts: {', '.join(paths)}")
+        print('\n'.join(summary))
+        return paths
+
+
+# Top functions by cumulative time
+def cpu_hotspots(profile, top_n=PROFILE_TOP_N):
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).strip_dirs().sort_stats('cumulative').print_stats(top_n)
+    return output.getvalue().strip()
+
+# Top source lines by memory still allocated when the snapshot was taken
+def memory_hotspots(snapshot, top_n=PROFILE_TOP_N):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    lines = [f"Top {top_n} allocation sites:"]
+    for statistic in snapshot.statistics('lineno')[:top_n]:
+        lines.append(f"  {statistic}")
+    return '\n'.join(lines)
+
+# Run a function under the profiler, tagging the artifacts with the run ID it returns
+def profile_run(name, function, mode=PROFILE_MODE):
+    """
+    Args: name (str): What is profiled (e.g. 'parser'). function (callable): The run, returning its run ID.
+          mode (str): Profile mode ('' or None runs the function unprofiled).
+    Returns: The function's return value.
+    """
+    if not mode:
+        return function()
+    profiler = Profiler(mode)
+    profiler.start()
+    result = None
+    try:
+        result = function()
+        return result
+    finally:
+        profiler.stop(f"{result}-{name}" if result else f"{name}-{time.strftime('%Y%m%dT%H%M%S')}")
+
+
+# Start profiling a sampled Celery task execution (connected to the task_prerun signal by the Celery apps)
+def start_task_profile(task_id=None, task=None, args=None, kwargs=None, **extra):
+    if not PROFILE_MODE or (PROFILE_TASKS and task.name.rsplit('.', 1)[-1] not in PROFILE_TASKS):
+        return
+    if random.random() >= PROFILE_TASK_SAMPLE_RATE:
+        return
+    profiler = Profiler(PROFILE_MODE)
+    _task_profilers[task_id] = (profiler, _task_run_id(task, args or (), kwargs or {}))
+    profiler.start()
+
+# Stop profiling a task execution and write its artifacts (connected to the task_postrun signal)
+def stop_task_profile(task_id=None, task=None, **extra):
+    profiler, run_id = _task_profilers.pop(task_id, (None, None))
+    if profiler is None:
+        return
+    profiler.stop('-'.join(part for part in (run_id, task.name.rsplit('.', 1)[-1], task_id) if part))
+
+# The run_id argument of a task execution, if the task takes one
+def _task_run_id(task, args, kwargs):
+    try:
+        return inspect.signature(task.run).bind(*args, **kwargs).arguments.get('run_id')
+    except TypeError:
+        return None
@@ -0,0 +1,85 @@
+from lxml import etree
+from utilities import parse_address
+
+# Precompiled XPath expressions, evaluated relative to a <Property> element. <ILS_Unit> blocks are found at any
+# depth, like the original per-unit loop, and the first <UnitBedrooms> of each unit is counted
+PROPERTY_ID_XPATH = etree.XPath('./PropertyID[1]')
+BEDROOMS_XPATH = etree.XPath('.//ILS_Unit/Units/Unit/UnitBedrooms[1]')
+
+
+# Compact record of the fields the parser reads from a <Property> element
+class PropertyRecord:
+    __slots__ = ('property_id', 'city', 'name', 'email', 'unparsed_address', 'parsed_address', 'bedrooms',
+                 'invalid_bedrooms')
+
+    def __init__(self, property_id, city, name, email, unparsed_address, parsed_address, bedrooms, invalid_bedrooms=()):
+        self.property_id = property_id
+        self.city = city
+        self.name = name
+        self.email = email
+        self.unparsed_address = unparsed_address
+        self.parsed_address = parsed_address
+        self.bedrooms = bedrooms
+        self.invalid_bedrooms = invalid_bedrooms
+
+    def __eq__(self, other):
+        if not isinstance(other, PropertyRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"PropertyRecord({fields})"
+
+
+# Sum the <UnitBedrooms> values of a property, setting aside values that aren't numbers ('', 'studio', ...)
+def count_bedrooms(bedrooms_elems):
+    """
+    Returns: tuple: (total bedrooms, tuple of the values that weren't counted, for the parser to report).
+    """
+    bedrooms = 0
+    invalid = []
+    for bedrooms_elem in bedrooms_elems:
+        value = bedrooms_elem.text
+        try:
+            bedrooms += int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            invalid.append(value)
+    return bedrooms, tuple(invalid)
+
+
+# Read every field the parser needs from a <Property> element in one pass over its <PropertyID> block
+def extract_property(property_elem):
+    """
+    Extracts the ID, city, contact details, address and total bedroom count of a <Property> element.
+    The <PropertyID> children are visited once and the bedroom count uses a single precompiled XPath,
+    instead of evaluating a separate XPath per field.
+    Args: property_elem (lxml.etree._Element): The <Property> element.
+    Returns: PropertyRecord: The extracted fields (missing values are None), with the <UnitBedrooms> values that
+             aren't numbers in invalid_bedrooms.
+    """
+    property_id = city = name = email = unparsed_address = None
+
+    property_id_elems = PROPERTY_ID_XPATH(property_elem)
+    if property_id_elems:
+        for child in property_id_elems[0]:
+            tag = child.tag
+            if tag == 'Identification':
+                if property_id is None:
+                    property_id = child.get('IDValue')
+            elif tag == 'MarketingName':
+                if name is None:
+                    name = child.text
+            elif tag == 'Email':
+                if email is None:
+                    email = child.text
+            elif tag == 'Address':
+                for address_child in child:
+                    if address_child.tag == 'City' and city is None:
+                        city = address_child.text
+                    elif address_child.tag == 'UnparsedAddress' and unparsed_address is None:
+                        unparsed_address = address_child.text
+
+    bedrooms, invalid_bedrooms = count_bedrooms(BEDROOMS_XPATH(property_elem))
+    parsed_address = parse_address(unparsed_address) if unparsed_address is not None else None
+    return PropertyRecord(property_id, city, name, email, unparsed_address, parsed_address, bedrooms, invalid_bedrooms)
@@ -0,0 +1,54 @@
+from botocore.exceptions import ClientError
+from utilities import content_digest
+
+# How a target property compares to the copy stored by the previous run
+ADDED = 'added'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+# Fingerprint of everything the parser stores for a property (and the address its weather job geocodes)
+def property_fingerprint(item, parsed_address):
+    """
+    Args: item (dict): The Properties item as written by the parser. parsed_address (str): The parsed address.
+    Returns: str: Hex digest stored on the item as 'content_fingerprint'.
+    """
+    return content_digest([item.get('name'), item.get('email'), item.get('bedrooms'), parsed_address])
+
+# Read the fingerprint of every property stored in the Properties table, and which of them have no weather yet
+def load_property_fingerprints(dynamodb):
+    """
+    Scans only the key, fingerprint and gridpoint reference attributes, following pagination. A property without a
+    'gridpoint_id' never got its weather saved (its weather job failed), so it needs a weather job even when unchanged.
+    Returns: tuple: (fingerprints, without_weather), where 'fingerprints' maps property_id -> content_fingerprint
+             (None for items written before fingerprints were stored) and 'without_weather' is the set of property IDs
+             without a gridpoint_id. (None, None) when the table could not be read (callers should then fall back to
+             a full load).
+    """
+    properties_table = dynamodb.Table('Properties')
+    scan_kwargs = {
+        'ProjectionExpression': 'property_id, content_fingerprint, gridpoint_id'
+    }
+    fingerprints = {}
+    without_weather = set()
+    try:
+        while True:
+            response = properties_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                fingerprints[item['property_id']] = item.get('content_fingerprint')
+                if not item.get('gridpoint_id'):
+                    without_weather.add(item['property_id'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except ClientError as e:
+        print(f"Error reading property fingerprints: {e}")
+        return None, None
+    return fingerprints, without_weather
+
+# Compare a property's fingerprint against the stored ones
+def classify_property(fingerprints, property_id, fingerprint):
+    if property_id not in fingerprints:
+        return ADDED
+    if fingerprints[property_id] != fingerprint:
+        return CHANGED
+    return UNCHANGED
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import redis
+
+# Redis holding the shared token buckets (the background tasks' broker, so every worker of both Celery apps sees them)
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+
+# While Redis is unreachable each process keeps its own buckets, at 1/RATE_LIMIT_FALLBACK_PROCESSES of the budget (the
+# number of worker processes expected to share it), and tries Redis again every RATE_LIMIT_REDIS_RETRY_SECONDS
+RATE_LIMIT_FALLBACK_PROCESSES = max(1, int(os.environ.get('RATE_LIMIT_FALLBACK_PROCESSES', '8')))
+RATE_LIMIT_REDIS_RETRY_SECONDS = float(os.environ.get('RATE_LIMIT_REDIS_RETRY_SECONDS', '30'))
+
+# Per-host budgets: (requests per second, burst size). Nominatim's usage policy allows at most 1 request per second
+RATE_LIMITS = {
+    'nominatim.openstreetmap.org': (float(os.environ.get('NOMINATIM_RATE_LIMIT', '1')), int(os.environ.get('NOMINATIM_RATE_BURST', '1'))),
+    'api.weather.gov': (float(os.environ.get('WEATHER_GOV_RATE_LIMIT', '10')), int(os.environ.get('WEATHER_GOV_RATE_BURST', '20')))
+}
+
+# Token bucket kept in a Redis hash. Takes a token (returns 0) or returns how many milliseconds to wait before trying
+# again. With a pause, empties the bucket and stops refilling it until the pause is over (used for Retry-After).
+# Redis' own clock is used so workers on different hosts agree on the time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local pause = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+local wait = 0
+if pause > 0 then
+    tokens = 0
+    ts = math.max(ts, now + pause)
+elseif now < ts then
+    return ts - now
+else
+    tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+    ts = now
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = math.ceil((1 - tokens) * 1000 / rate)
+    end
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', ts)
+redis.call('PEXPIRE', KEYS[1], math.max(ts - now, 0) + math.ceil(capacity * 1000 / rate) + 60000)
+return wait
+"""
+
+# Token bucket limiting requests per host, shared through Redis by every process using the same Redis
+class RateLimiter:
+    """
+    Args:
+        limits (dict): host -> (requests per second, burst size). Hosts not listed are not limited.
+        redis_url (str): Redis holding the buckets. When Redis can't be reached the limiter falls back to
+                         in-process buckets until Redis answers again.
+        key_prefix (str): Prefix of the Redis keys holding the buckets.
+        fallback_processes (int): Processes expected to share the budget. The in-process buckets get this share of
+                                  it, so all the workers together still keep to the budget while Redis is down.
+        redis_retry_seconds (float): Seconds to wait after a Redis error before trying Redis again.
+    """
+
+    def __init__(self, limits, redis_url=RATE_LIMIT_REDIS_URL, key_prefix='ratelimit',
+                 fallback_processes=RATE_LIMIT_FALLBACK_PROCESSES, redis_retry_seconds=RATE_LIMIT_REDIS_RETRY_SECONDS):
+        self.limits = limits
+        self.key_prefix = key_prefix
+        self.fallback_processes = max(1, fallback_processes)
+        self.redis_retry_seconds = redis_retry_seconds
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.local_buckets = {}
+        self.lock = threading.Lock()
+        self.redis_retry_at = None  # Monotonic time Redis is tried again after an error (None while it answers)
+
+    def acquire(self, url):
+        """
+        Blocks until the URL's host has a token available (returns immediately for hosts without a budget).
+        Returns: float: Seconds spent waiting.
+        """
+        host = urlsplit(url).hostname
+        if host not in self.limits:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = self._take(host, 0)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, url, seconds):
+        """
+        Stops handing out tokens for the URL's host for 'seconds' (e.g. from a Retry-After header), in every worker.
+        """
+        host = urlsplit(url).hostname
+        if host in self.limits and seconds > 0:
+            self._take(host, seconds)
+
+    # Take a token (or apply a pause) and return the seconds to wait before trying again
+    def _take(self, host, pause_seconds):
+        rate, burst = self.limits[host]
+        retry_at = self.redis_retry_at
+        if retry_at is None or time.monotonic() >= retry_at:
+            try:
+                wait_ms = self.script(keys=[f"{self.key_prefix}:{host}"], args=[rate, burst, int(pause_seconds * 1000)])
+            except redis.exceptions.RedisError as e:
+                if retry_at is None:
+                    print(f"Rate limiter can't reach Redis ({e}), limiting requests in this process to "
+                          f"1/{self.fallback_processes} of the budget until it answers again")
+                self.redis_retry_at = time.monotonic() + self.redis_retry_seconds
+            else:
+                if retry_at is not None:
+                    print("Rate limiter reached Redis again, back to the shared budget")
+                    self.redis_retry_at = None
+                return int(wait_ms) / 1000
+        return self._take_local(host, rate / self.fallback_processes, max(1, burst // self.fallback_processes), pause_seconds)
+
+    # Same token bucket as TOKEN_BUCKET_SCRIPT, kept in process (with this process' share of the budget)
+    def _take_local(self, host, rate, burst, pause_seconds):
+        with self.lock:
+            now = time.monotonic()
+            tokens, ts = self.local_buckets.get(host, (burst, now))
+            wait = 0.0
+            if pause_seconds > 0:
+                tokens, ts = 0, max(ts, now + pause_seconds)
+            elif now < ts:
+                return ts - now
+            else:
+                tokens, ts = min(burst, tokens + (now - ts) * rate), now
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+            self.local_buckets[host] = (tokens, ts)
+            return wait
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+# Get the process-wide rate limiter (created on first use, so forked Celery workers each open their own connection)
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(RATE_LIMITS)
+    return _limiter
@@ -0,0 +1,157 @@
+import os
+import random
+import time
+from datetime import datetime
+from botocore.exceptions import ClientError
+from weather_store import GRIDPOINT_FORECASTS_TABLE, gridpoint_id_from_url
+
+# Never check a gridpoint more often than REFRESH_MIN_INTERVAL or less often than REFRESH_MAX_INTERVAL (seconds).
+# NWS issues a new forecast about every REFRESH_EXPECTED_UPDATE_INTERVAL after its updateTime, so that is when the
+# next check is scheduled; a forecast still not replaced REFRESH_STALE_AFTER after its updateTime gets priority
+REFRESH_MIN_INTERVAL = int(os.environ.get('REFRESH_MIN_INTERVAL', '300'))
+REFRESH_MAX_INTERVAL = int(os.environ.get('REFRESH_MAX_INTERVAL', str(3 * 60 * 60)))
+REFRESH_EXPECTED_UPDATE_INTERVAL = int(os.environ.get('REFRESH_EXPECTED_UPDATE_INTERVAL', str(60 * 60)))
+REFRESH_STALE_AFTER = int(os.environ.get('REFRESH_STALE_AFTER', str(2 * 60 * 60)))
+
+# Most gridpoints queued per scheduler tick (the rest stay due and are picked up by the next ticks)
+REFRESH_MAX_GRIDPOINTS_PER_TICK = int(os.environ.get('REFRESH_MAX_GRIDPOINTS_PER_TICK', '50'))
+
+# Priority tiers, lowest first: gridpoints whose forecast is stale, gridpoints simply due
+TIER_STALE = 0
+TIER_DUE = 1
+
+# Convert an NWS timestamp ('2024-10-19T09:58:54+00:00') to epoch seconds (None if missing or invalid)
+def parse_nws_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+# When to check a gridpoint next, given the updateTime of the forecast we hold
+def next_check_time(update_time, now):
+    expected_update = parse_nws_time(update_time)
+    if expected_update is None:
+        return now + REFRESH_MIN_INTERVAL
+    expected_update += REFRESH_EXPECTED_UPDATE_INTERVAL
+    return min(max(expected_update, now + REFRESH_MIN_INTERVAL), now + REFRESH_MAX_INTERVAL)
+
+# Priority of a gridpoint schedule entry
+def refresh_priority(entry, now):
+    """
+    Args: entry (dict): A GridpointForecasts item (see scan_gridpoint_schedule). now (float): Epoch seconds.
+    Returns: tuple: (tier, due time) to sort due entries by, or None if the gridpoint isn't due yet.
+    """
+    # Forecasts saved by the background tasks count as checked when they were stored
+    last_checked = entry.get('last_checked_at') or entry.get('stored_at') or 0
+    due_at = float(entry.get('next_check_at') or next_check_time(entry.get('update_time'), float(last_checked)))
+    if due_at > now:
+        return None
+    update_time = parse_nws_time(entry.get('update_time'))
+    if update_time is not None and now - update_time > REFRESH_STALE_AFTER:
+        return TIER_STALE, due_at
+    return TIER_DUE, due_at
+
+# Read the schedule fields of every gridpoint (one item per NWS gridpoint, so this stays small as properties grow)
+def scan_gridpoint_schedule(dynamodb):
+    gridpoint_table = dynamodb.Table(GRIDPOINT_FORECASTS_TABLE)
+    scan_kwargs = {
+        'ProjectionExpression': 'gridpoint_id, forecast_url, update_time, stored_at, last_checked_at, next_check_at'
+    }
+    entries = []
+    while True:
+        response = gridpoint_table.scan(**scan_kwargs)
+        entries.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return entries
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Pick the gridpoints to refresh this tick
+def select_due_gridpoints(entries, now, limit=REFRESH_MAX_GRIDPOINTS_PER_TICK):
+    """
+    Returns: tuple: (the due entries to refresh, most urgent first and at most 'limit' of them, number of due entries).
+    """
+    due = []
+    for entry in entries:
+        if not entry.get('forecast_url'):
+            continue
+        priority = refresh_priority(entry, now)
+        if priority is not None:
+            due.append((priority, entry))
+    due.sort(key=lambda prioritized: prioritized[0])
+    return [entry for _, entry in due[:limit]], len(due)
+
+# Record that a gridpoint was checked and schedule its next check
+def record_gridpoint_check(dynamodb, forecast_url, update_time=None, interval=None):
+    """
+    Args:
+        forecast_url (str): The gridpoint forecast URL that was fetched.
+        update_time (str): updateTime of the forecast now held, stored on the item so it follows the forecast even
+                           when NWS reissues the same periods (None when unknown, e.g. after a failed fetch).
+        interval (float): Seconds until the next check, overriding the updateTime based schedule.
+    """
+    now = time.time()
+    next_check_at = now + interval if interval is not None else next_check_time(update_time, now)
+    update_expression = "SET forecast_url = :forecast_url, last_checked_at = :now, next_check_at = :next_check_at"
+    values = {':forecast_url': forecast_url, ':now': int(now), ':next_check_at': int(next_check_at)}
+    if update_time:
+        update_expression += ", update_time = :update_time"
+        values[':update_time'] = update_time
+    try:
+        dynamodb.Table(GRIDPOINT_FORECASTS_TABLE).update_item(
+            Key={'gridpoint_id': gridpoint_id_from_url(forecast_url)},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        print(f"Error recording refresh of {forecast_url}: {e}")
+
+# Read the updateTime of the forecasts stored for some gridpoints with BatchGetItem
+def load_update_times(dynamodb, forecast_urls, max_retries=8, base_backoff=0.05):
+    """
+    Returns: dict: forecast URL -> updateTime of the stored forecast (gridpoints without one are left out).
+    """
+    urls_by_gridpoint = {gridpoint_id_from_url(forecast_url): forecast_url for forecast_url in forecast_urls}
+    keys = [{'gridpoint_id': gridpoint_id} for gridpoint_id in urls_by_gridpoint]
+    update_times = {}
+    for start in range(0, len(keys), 100):  # BatchGetItem accepts at most 100 keys per call
+        request_items = {GRIDPOINT_FORECASTS_TABLE: {'Keys': keys[start:start + 100],
+                                                     'ProjectionExpression': 'gridpoint_id, update_time'}}
+        attempt = 0
+        while request_items:
+            try:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+            except ClientError as e:
+                print(f"Error reading gridpoint update times: {e}")
+                break
+            for item in response.get('Responses', {}).get(GRIDPOINT_FORECASTS_TABLE, []):
+                if item.get('update_time'):
+                    update_times[urls_by_gridpoint[item['gridpoint_id']]] = item['update_time']
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                if attempt >= max_retries:
+                    print(f"Giving up on {len(request_items[GRIDPOINT_FORECASTS_TABLE]['Keys'])} unprocessed gridpoint reads")
+                    break
+                time.sleep(random.uniform(0, base_backoff * (2 ** attempt)))
+                attempt += 1
+    return update_times
+
+# Hold queued gridpoints back from the next ticks until their refresh has had time to run
+def lease_gridpoints(dynamodb, forecast_urls, lease=REFRESH_MIN_INTERVAL):
+    """
+    Args:
+        forecast_urls (list): The gridpoint forecast URLs just queued for a refresh.
+        lease (float): Seconds before the gridpoints are due again if no refresh records a check meanwhile.
+    """
+    lease_until = int(time.time() + lease)
+    gridpoint_table = dynamodb.Table(GRIDPOINT_FORECASTS_TABLE)
+    for forecast_url in forecast_urls:
+        try:
+            gridpoint_table.update_item(
+                Key={'gridpoint_id': gridpoint_id_from_url(forecast_url)},
+                UpdateExpression="SET next_check_at = :lease_until",
+                ExpressionAttributeValues={':lease_until': lease_until}
+            )
+        except ClientError as e:
+            print(f"Error leasing {forecast_url} for a refresh: {e}")
@@ -0,0 +1,226 @@
+import time
+import zlib
+from collections import defaultdict
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from batch_writer import BatchWriter
+from instrumentation import timer
+
+# Table holding per-property detail records, split across shards so no single partition key gets hot
+DETAILS_TABLE_NAME = 'RunStatisticsDetails'
+DEFAULT_DETAIL_SHARDS = 8
+
+# Record type of the per-property records weather jobs write, and the RunStatistics fields derived from them
+BACKGROUND_JOB_RECORD = 'background_job'
+BACKGROUND_COUNTERS = ('successful_api_calls', 'background_api_calls_count', 'geocode_cache_hits', 'geocode_cache_misses')
+BACKGROUND_TIMINGS = ('total_background_time', 'total_api_sum_time', 'total_geocoding_api_time', 'total_weather_api_time')
+
+# Partition key of the detail record for a given run, record key and shard count
+def detail_partition_key(run_id, key, shards=DEFAULT_DETAIL_SHARDS):
+    shard = zlib.crc32(str(key).encode('utf-8')) % shards
+    return f"{run_id}#{shard}"
+
+# Build a detail record item for the RunStatisticsDetails table
+def build_detail_item(run_id, record_type, key, record, shards=DEFAULT_DETAIL_SHARDS):
+    item = dict(record)
+    item.update({
+        'run_shard': detail_partition_key(run_id, key, shards),
+        'record_id': f"{record_type}#{key}",
+        'run_id': run_id,
+        'record_type': record_type
+    })
+    return item
+
+# Write a single detail record (used by workers that only produce one record per task)
+def put_detail_record(dynamodb, run_id, record_type, key, record, shards=DEFAULT_DETAIL_SHARDS):
+    try:
+        dynamodb.Table(DETAILS_TABLE_NAME).put_item(Item=build_detail_item(run_id, record_type, key, record, shards))
+    except ClientError as e:
+        print(f"Error saving {record_type} detail record for {key}: {e}")
+
+# Read back every detail record for a run by querying each shard
+def get_detail_records(dynamodb, run_id, shards=DEFAULT_DETAIL_SHARDS, record_type=None):
+    details_table = dynamodb.Table(DETAILS_TABLE_NAME)
+    records = []
+    for shard in range(shards):
+        query_kwargs = {'KeyConditionExpression': Key('run_shard').eq(f"{run_id}#{shard}")}
+        if record_type:
+            query_kwargs['KeyConditionExpression'] &= Key('record_id').begins_with(f"{record_type}#")
+        while True:
+            response = details_table.query(**query_kwargs)
+            records.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return records
+
+
+# Collect run statistics in process and flush them to DynamoDB in coalesced updates
+class RunStatisticsAccumulator:
+    """
+    Accumulates counters, timings and per-property detail records for a run instead of issuing an UpdateItem
+    against the RunStatistics row for every event. Counter and timing deltas are written in a single atomic
+    UpdateItem per flush, and detail records are batch written to the sharded RunStatisticsDetails table.
+    A flush happens whenever 'flush_interval' seconds have passed since the last one, and on flush().
+
+    Args:
+        dynamodb: boto3 DynamoDB service resource.
+        run_id (str): The ID of the run the statistics belong to.
+        flush_interval (float): Seconds between automatic flushes (0 flushes only when flush() is called).
+        detail_shards (int): Number of partition key shards for the detail records.
+    """
+
+    def __init__(self, dynamodb, run_id, flush_interval=5.0, detail_shards=DEFAULT_DETAIL_SHARDS):
+        self.dynamodb = dynamodb
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.detail_shards = detail_shards
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(Decimal)
+        self.values = {}
+        self.detail_writer = BatchWriter(dynamodb, DETAILS_TABLE_NAME)
+        self.last_flush = time.monotonic()
+        self.flush_count = 0
+
+    def increment(self, field, increment_by=1):
+        self.counters[field] += increment_by
+        self._maybe_flush()
+
+    def add_time(self, field, seconds):
+        self.timings[field] += Decimal(str(seconds))
+        self._maybe_flush()
+
+    def set(self, field, value):
+        self.values[field] = value
+
+    def record_detail(self, record_type, key, record):
+        self.detail_writer.put(build_detail_item(self.run_id, record_type, key, record, self.detail_shards))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.flush_interval and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all accumulated counter/timing deltas and set values to the RunStatistics row in one UpdateItem,
+        then writes any buffered detail records.
+        """
+        with timer('stats_flush'):
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        self.detail_writer.flush()
+
+        assignments = []
+        attribute_names = {}
+        attribute_values = {}
+        deltas = list(self.counters.items()) + list(self.timings.items())
+        for i, (field, amount) in enumerate(deltas):
+            attribute_names[f"#d{i}"] = field
+            attribute_values[f":d{i}"] = amount
+            assignments.append(f"#d{i} = if_not_exists(#d{i}, :zero) + :d{i}")
+        for i, (field, value) in enumerate(self.values.items()):
+            attribute_names[f"#s{i}"] = field
+            attribute_values[f":s{i}"] = value
+            assignments.append(f"#s{i} = :s{i}")
+        if not assignments:
+            return
+
+        if deltas:
+            attribute_values[':zero'] = 0
+        try:
+            self.dynamodb.Table('RunStatistics').update_item(
+                Key={'run_id': self.run_id},
+                UpdateExpression="SET " + ", ".join(assignments),
+                ExpressionAttributeNames=attribute_names,
+                ExpressionAttributeValues=attribute_values
+            )
+        except ClientError as e:
+            # Keep the deltas so they are retried on the next flush
+            print(f"Error flushing run statistics for {self.run_id}: {e}")
+            return
+        self.counters.clear()
+        self.timings.clear()
+        self.values.clear()
+        self.flush_count += 1
+
+
+# Build the statistics record of one weather job
+def build_background_job_record(property_id, succeeded, counts, geocoding_api_time, weather_api_time, background_time):
+    """
+    Args:
+        property_id (str): The property the job was for.
+        succeeded (bool): Whether weather data was saved for the property.
+        counts (dict): Geocode cache hits and misses of the job ('geocode_cache_hits', 'geocode_cache_misses').
+        geocoding_api_time, weather_api_time, background_time (float): Seconds spent geocoding, on api.weather.gov
+                                                                       and on the whole job.
+    Returns: dict: The record to store with put_detail_record / build_detail_item.
+    """
+    return {
+        'property_id': property_id,
+        'succeeded': succeeded,
+        'geocode_cache_hits': counts.get('geocode_cache_hits', 0),
+        'geocode_cache_misses': counts.get('geocode_cache_misses', 0),
+        'geocoding_api_time': Decimal(str(geocoding_api_time)),
+        'weather_api_time': Decimal(str(weather_api_time)),
+        'api_sum_time': Decimal(str(geocoding_api_time + weather_api_time)),
+        'background_time': Decimal(str(background_time))
+    }
+
+# Derive the background job totals and averages of a run from its per-property records
+def summarize_background_jobs(dynamodb, run_id, shards=DEFAULT_DETAIL_SHARDS):
+    """
+    Weather jobs never update the RunStatistics row: each writes one record on its own key, and the totals are
+    summed here when they are read. Only successful jobs count towards the API call totals and averages.
+    Returns: dict: The BACKGROUND_COUNTERS and BACKGROUND_TIMINGS totals, plus 'average_time_per_property_background'
+             and 'average_api_call_time' (both per successful job).
+    """
+    summary = dict.fromkeys(BACKGROUND_COUNTERS, 0)
+    summary.update(dict.fromkeys(BACKGROUND_TIMINGS, Decimal('0')))
+    for record in get_detail_records(dynamodb, run_id, shards, record_type=BACKGROUND_JOB_RECORD):
+        summary['geocode_cache_hits'] += int(record.get('geocode_cache_hits', 0))
+        summary['geocode_cache_misses'] += int(record.get('geocode_cache_misses', 0))
+        if not record.get('succeeded', True):  # Records from before jobs stored their outcome were all successes
+            continue
+        summary['successful_api_calls'] += 1
+        summary['background_api_calls_count'] += 1
+        summary['total_background_time'] += record.get('background_time', Decimal('0'))
+        summary['total_api_sum_time'] += record.get('api_sum_time', Decimal('0'))
+        summary['total_geocoding_api_time'] += record.get('geocoding_api_time', Decimal('0'))
+        summary['total_weather_api_time'] += record.get('weather_api_time', Decimal('0'))
+
+    count = summary['background_api_calls_count']
+    summary['average_time_per_property_background'] = summary['total_background_time'] / count if count else Decimal('0')
+    summary['average_api_call_time'] = summary['total_api_sum_time'] / count if count else Decimal('0')
+    return summary
+
+# Write the derived background totals and averages onto the RunStatistics row (run once the weather jobs are done)
+def finalize_run_statistics(dynamodb, run_id):
+    statistics_table = dynamodb.Table('RunStatistics')
+    response = statistics_table.get_item(Key={'run_id': run_id})
+    shards = int(response.get('Item', {}).get('detail_shards', DEFAULT_DETAIL_SHARDS))
+    summary = summarize_background_jobs(dynamodb, run_id, shards)
+
+    fields = list(summary.items())
+    try:
+        statistics_table.update_item(
+            Key={'run_id': run_id},
+            UpdateExpression="SET " + ", ".join(f"#f{i} = :f{i}" for i in range(len(fields))),
+            ExpressionAttributeNames={f"#f{i}": field for i, (field, _) in enumerate(fields)},
+            ExpressionAttributeValues={f":f{i}": value for i, (_, value) in enumerate(fields)}
+        )
+    except ClientError as e:
+        print(f"Error finalizing run statistics for {run_id}: {e}")
+    return summary
+
+
+# Finalize a run's statistics from the command line: python3 run_statistics.py <run_id>
+if __name__ == '__main__':
+    import sys
+    from data_access import get_dynamodb
+
+    for field, value in finalize_run_statistics(get_dynamodb(), sys.argv[1]).items():
+        print(f"{field}: {value}")
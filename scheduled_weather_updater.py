@@ -1,7 +1,15 @@
-import requests
-import boto3
-from utilities import convert_floats_to_decimal
-from celery import Celery
+import os
+import time
+from collections import defaultdict
+from utilities import forecast_digest, content_digest
+from weather_store import gridpoint_id_from_url, save_gridpoint_forecast, save_property_weather, WRITTEN, UNCHANGED, WRITE_FAILED
+from refresh_scheduler import scan_gridpoint_schedule, select_due_gridpoints, record_gridpoint_check, lease_gridpoints, load_update_times, REFRESH_MAX_GRIDPOINTS_PER_TICK, REFRESH_MAX_INTERVAL
+from http_client import fetch_json_conditional, iter_fetch_json, MODIFIED, NOT_MODIFIED
+from data_access import get_dynamodb, update_weatherlink_validators, scan_weatherlink_segment, query_weatherlink_rows
+from instrumentation import timer, increment, get_logger, log_sampled, start_worker_metrics_server
+from profiling import start_task_profile, stop_task_profile
+from celery import Celery, chord
+from celery.signals import worker_process_init, task_prerun, task_postrun
 from botocore.exceptions import ClientError
 
 # Celery configuration
@@ -10,51 +18,59 @@ app = Celery(
     broker='redis://localhost:6379/1',
     backend='redis://localhost:6379/1'
 )
+
+# Every worker process serves its own stage histograms and counters on a local OpenMetrics endpoint
+worker_process_init.connect(start_worker_metrics_server)
+
+# With PROFILE_MODE set, a sample of the task executions is profiled (see profiling.py)
+task_prerun.connect(start_task_profile)
+task_postrun.connect(stop_task_profile)
+
+logger = get_logger('scheduled_weather_updater')
+# Seconds between scheduler ticks, and between full sweeps of the WeatherLink table (which also pick up forecast
+# URLs the scheduler doesn't know about yet)
+REFRESH_TICK_SECONDS = float(os.environ.get('REFRESH_TICK_SECONDS', '30'))
+REFRESH_FULL_SWEEP_SECONDS = float(os.environ.get('REFRESH_FULL_SWEEP_SECONDS', str(6 * 60 * 60)))
+
+# Number of parallel scan segments of the WeatherLink table, each refreshed by its own subtask
+REFRESH_SCAN_SEGMENTS = int(os.environ.get('REFRESH_SCAN_SEGMENTS', '4'))
+
+# Number of gridpoints refreshed per refresh_gridpoints subtask
+REFRESH_GRIDPOINTS_PER_TASK = int(os.environ.get('REFRESH_GRIDPOINTS_PER_TASK', '10'))
+
 # Celery beat schedule
 app.conf.beat_schedule = {
-    'update-weather-every-30-seconds': {
-        'task': 'scheduled_weather_updater.update_weather_from_weatherlink',  # Name of the task
-        'schedule': 30.0,  # Run every 30 seconds
+    'schedule-due-weather-refreshes': {
+        'task': 'scheduled_weather_updater.schedule_weather_refresh',  # Queues only the gridpoints that are due
+        'schedule': REFRESH_TICK_SECONDS,
+    },
+    'full-weather-sweep': {
+        'task': 'scheduled_weather_updater.update_weather_from_weatherlink',  # Refreshes every WeatherLink row
+        'schedule': REFRESH_FULL_SWEEP_SECONDS,
     },
 }
 
-# Connect to DynamoDB
-dynamodb = boto3.resource('dynamodb',
-                          endpoint_url='http://localhost:8000',  # Use actual endpoint URL if not local
-                          region_name='dummy',
-                          aws_access_key_id='dummy',
-                          aws_secret_access_key='dummy'
-                          )
-
-# Fetch weather data using the forecast URL
-def fetch_weather_data_from_url(forecast_url):
-    print(f"Fetching weather data from URL: {forecast_url}")
-    response = requests.get(forecast_url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch weather data from {forecast_url}, status code: {response.status_code}")
-        return None
-
-# Update weather data in the Properties table
-def update_weather_data_in_properties(property_id, weather_data, parsed_weather_data, detailed_forecast):
-    properties_table = dynamodb.Table('Properties')
+# Fetch weather data using the forecast URL (over the pooled HTTP session)
+def fetch_weather_data_from_url(forecast_url, etag=None, last_modified=None):
+    """
+    Sends a conditional GET when the ETag / Last-Modified of the forecast we already hold are known.
+    Returns: FetchResult: status MODIFIED with the forecast JSON, NOT_MODIFIED for a 304, or FAILED.
+    """
+    log_sampled(logger, "Fetching weather data from URL: %s", forecast_url)
+    with timer('forecast'):
+        result = fetch_json_conditional(forecast_url, etag=etag, last_modified=last_modified)
+    increment('forecast_fetches', status=result.status)
+    return result
 
-    weather_data = convert_floats_to_decimal(weather_data)
-
-    try:
-        properties_table.update_item(
-            Key={'property_id': property_id},
-            UpdateExpression="SET weather_data = :weather_data, next_period_weather_data = :next_period_weather_data, next_period_forecast = :next_period_forecast",
-            ExpressionAttributeValues={
-                ':weather_data': weather_data,
-                ':next_period_weather_data': parsed_weather_data,
-                ':next_period_forecast': detailed_forecast
-            }
-        )
-        print(f"Weather data updated for property_id {property_id}")
-    except ClientError as e:
-        print(f"Error updating weather data for {property_id}: {e}")
+# Update the weather summary of a property in the Properties table
+def update_weather_data_in_properties(property_id, gridpoint_id, parsed_weather_data, detailed_forecast):
+    """
+    Writes the next-period summary and gridpoint reference, conditional on their digest having changed, so an
+    unchanged forecast costs a failed condition check instead of a rewrite.
+    Returns: str: WRITTEN, UNCHANGED or WRITE_FAILED.
+    """
+    digest = content_digest([gridpoint_id, parsed_weather_data, detailed_forecast])
+    return save_property_weather(get_dynamodb(), property_id, gridpoint_id, parsed_weather_data, detailed_forecast, digest)
 
 # Parse the weather data
 def parse_weather_data(weather_data):
@@ -66,29 +82,156 @@ def parse_weather_data(weather_data):
     detailed_forecast = weather_data['properties']['periods'][0]['detailedForecast']
     return parsed_weather_data, detailed_forecast
 
-# Celery beat task to update weather data
-@app.task
-def update_weather_from_weatherlink():
-    weatherlink_table = dynamodb.Table('WeatherLink')
+# Map each forecast URL to the WeatherLink rows that use it (rows without a forecast URL are skipped)
+def group_rows_by_forecast_url(items):
+    rows_by_url = defaultdict(list)
+    for item in items:
+        forecast_url = item.get('forecast_url')
+        if forecast_url:
+            rows_by_url[forecast_url].append(item)
+    return rows_by_url
 
-    try:
-        response = weatherlink_table.scan()
-        items = response.get('Items', [])
+# Validators to send for a group of rows: only when every property holds the same version of the forecast
+def shared_validators(rows):
+    validators = {(row.get('etag'), row.get('last_modified')) for row in rows}
+    if len(validators) == 1:
+        return validators.pop()
+    return None, None
+
+# Refresh the weather of a set of WeatherLink rows
+def refresh_weatherlink_rows(items, update_times=None):
+    """
+    Fetches each forecast URL used by the rows once, concurrently, and updates the properties whose forecast changed.
+    Every fetched gridpoint gets its next check scheduled from the updateTime of the forecast it now holds.
+    Args: items (list): WeatherLink rows. update_times (dict): forecast URL -> updateTime of the stored forecast,
+          used to schedule gridpoints answering 304 (read from GridpointForecasts when not given).
+    Returns: dict: Counts of properties, forecast URLs, 304s, fetch failures, gridpoints written and properties
+             written / unchanged / failed.
+    """
+    # Group properties by forecast URL, since nearby properties share the same NWS gridpoint
+    rows_by_url = group_rows_by_forecast_url(items)
+    validators_by_url = {forecast_url: shared_validators(rows) for forecast_url, rows in rows_by_url.items()}
+    print(f"Refreshing {len(rows_by_url)} forecast URLs for {len(items)} properties")
+
+    # Fetch the latest weather data once per forecast URL, concurrently, and update as each response arrives
+    def fetch(forecast_url):
+        return fetch_weather_data_from_url(forecast_url, *validators_by_url[forecast_url])
 
-        for item in items:
-            property_id = item.get('property_id')
-            forecast_url = item.get('forecast_url')
+    # Per-cycle counts, so we can confirm writes are only paid for forecasts that actually changed
+    cycle_stats = {'properties': len(items), 'forecast_urls': len(rows_by_url), 'not_modified': 0, 'fetch_failed': 0,
+                   'gridpoints_written': 0, WRITTEN: 0, UNCHANGED: 0, WRITE_FAILED: 0}
+    not_modified_urls = []
+    for forecast_url, result in iter_fetch_json(rows_by_url, fetch=fetch):
+        rows = rows_by_url[forecast_url]
+        if result.status == NOT_MODIFIED:
+            # NWS hasn't issued a new forecast since the one every property in the group already holds
+            cycle_stats['not_modified'] += 1
+            not_modified_urls.append(forecast_url)
+            continue
+        if result.status != MODIFIED:
+            cycle_stats['fetch_failed'] += 1
+            record_gridpoint_check(get_dynamodb(), forecast_url)
+            continue
 
-            if not forecast_url:
-                continue
+        # The full forecast is stored once per gridpoint
+        weather_data = result.data
+        gridpoint_id = gridpoint_id_from_url(forecast_url)
+        if save_gridpoint_forecast(get_dynamodb(), forecast_url, weather_data, forecast_digest(weather_data)) == WRITTEN:
+            cycle_stats['gridpoints_written'] += 1
+        parsed_weather_data, detailed_forecast = parse_weather_data(weather_data)
+        record_gridpoint_check(get_dynamodb(), forecast_url, weather_data.get('properties', {}).get('updateTime'))
 
-            # Fetch the latest weather data using the forecast URL
-            weather_data = fetch_weather_data_from_url(forecast_url)
-            if weather_data:
-                parsed_weather_data, detailed_forecast = parse_weather_data(weather_data)
+        # Update the weather summary in the Properties table for every property sharing the gridpoint
+        for row in rows:
+            property_id = row.get('property_id')
+            cycle_stats[update_weather_data_in_properties(property_id, gridpoint_id, parsed_weather_data, detailed_forecast)] += 1
+            if (row.get('etag'), row.get('last_modified')) != (result.etag, result.last_modified):
+                update_weatherlink_validators(property_id, result.etag, result.last_modified)
 
-                # Update the weather data in the Properties table
-                update_weather_data_in_properties(property_id, weather_data, parsed_weather_data, detailed_forecast)
+    # Gridpoints answering 304 still hold the same forecast, so their next check follows its stored updateTime
+    if not_modified_urls and update_times is None:
+        update_times = load_update_times(get_dynamodb(), not_modified_urls)
+    for forecast_url in not_modified_urls:
+        record_gridpoint_check(get_dynamodb(), forecast_url, (update_times or {}).get(forecast_url))
+    return cycle_stats
 
+# Celery subtask refreshing one segment of the WeatherLink table
+@app.task
+def refresh_weatherlink_segment(segment, total_segments):
+    try:
+        items = scan_weatherlink_segment(segment, total_segments)
     except ClientError as e:
-        print(f"Error scanning WeatherLink table: {e}")
\ No newline at end of file
+        print(f"Error scanning WeatherLink table segment {segment}/{total_segments}: {e}")
+        return None
+    cycle_stats = refresh_weatherlink_rows(items)
+    print(f"Weather refresh segment {segment}/{total_segments}: {cycle_stats}")
+    return cycle_stats
+
+# Celery callback adding up the counts of every segment of a refresh
+@app.task
+def merge_refresh_stats(segment_stats):
+    cycle_stats = defaultdict(int)
+    failed_segments = 0
+    for stats in segment_stats:
+        if stats is None:
+            failed_segments += 1
+            continue
+        for field, count in stats.items():
+            cycle_stats[field] += count
+    cycle_stats['failed_segments'] = failed_segments
+    print(f"Weather refresh cycle: {dict(cycle_stats)}")
+    return dict(cycle_stats)
+
+# Celery beat task to update weather data
+@app.task
+def update_weather_from_weatherlink(total_segments=None):
+    """
+    Splits the WeatherLink table into REFRESH_SCAN_SEGMENTS parallel scan segments and refreshes each in its own
+    subtask, so the refresh spreads across every worker. The segment counts are added up by merge_refresh_stats.
+    """
+    total_segments = max(1, total_segments or REFRESH_SCAN_SEGMENTS)
+    print(f"Refreshing WeatherLink table in {total_segments} segments")
+    refresh = chord(refresh_weatherlink_segment.s(segment, total_segments) for segment in range(total_segments))(merge_refresh_stats.s())
+    return refresh.id
+
+# Celery subtask refreshing the properties of a few gridpoints
+@app.task
+def refresh_gridpoints(forecast_urls, update_times=None):
+    items = []
+    for forecast_url in forecast_urls:
+        rows = query_weatherlink_rows(forecast_url)
+        if not rows:
+            # No property uses this gridpoint any more, so only look at it again after the longest interval
+            record_gridpoint_check(get_dynamodb(), forecast_url, interval=REFRESH_MAX_INTERVAL)
+        items.extend(rows)
+    cycle_stats = refresh_weatherlink_rows(items, update_times)
+    print(f"Gridpoint refresh: {cycle_stats}")
+    return cycle_stats
+
+# Celery beat task queueing the gridpoints that are due for a refresh
+@app.task
+def schedule_weather_refresh(max_gridpoints=None):
+    """
+    Checks the schedule kept on the GridpointForecasts items and queues only the gridpoints that are due, most
+    urgent first (stale forecasts, then the rest by due time), at most REFRESH_MAX_GRIDPOINTS_PER_TICK per tick.
+    Queued gridpoints are leased for REFRESH_MIN_INTERVAL, so later ticks don't queue them again while the workers
+    catch up. Properties are only read for the gridpoints being refreshed, so a tick costs the same however many
+    properties there are.
+    Returns: dict: Number of known gridpoints, how many are due and how many were queued.
+    """
+    try:
+        entries = scan_gridpoint_schedule(get_dynamodb())
+    except ClientError as e:
+        print(f"Error reading the gridpoint refresh schedule: {e}")
+        return None
+    due_entries, due_count = select_due_gridpoints(entries, time.time(), max_gridpoints or REFRESH_MAX_GRIDPOINTS_PER_TICK)
+    lease_gridpoints(get_dynamodb(), [entry['forecast_url'] for entry in due_entries])
+
+    for start in range(0, len(due_entries), REFRESH_GRIDPOINTS_PER_TASK):
+        chunk = due_entries[start:start + REFRESH_GRIDPOINTS_PER_TASK]
+        refresh_gridpoints.delay([entry['forecast_url'] for entry in chunk],
+                                 {entry['forecast_url']: entry.get('update_time') for entry in chunk})
+
+    tick_stats = {'gridpoints': len(entries), 'due': due_count, 'queued': len(due_entries)}
+    print(f"Weather refresh tick: {tick_stats}")
+    return tick_stats
@@ -0,0 +1,45 @@
+"""
+Shared fixtures: moto's in-memory DynamoDB with the pipeline tables, and the benchmarks' stub of api.weather.gov.
+"""
+import os
+import threading
+import pytest
+
+# The tests never reach a real DynamoDB, and don't serve metrics (set before the pipeline modules read them)
+os.environ['DYNAMODB_ENDPOINT_URL'] = ''
+os.environ['DYNAMODB_REGION'] = 'us-east-1'
+os.environ['METRICS_PORT'] = '0'
+
+FORECAST_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures', 'nws_forecast.json')
+
+
+# moto's in-memory DynamoDB, without any table
+@pytest.fixture
+def empty_dynamodb(monkeypatch):
+    moto = pytest.importorskip('moto')
+    import data_access
+    with moto.mock_aws():
+        # Resources built outside the mock would talk to the real endpoint
+        monkeypatch.setattr(data_access, '_local', threading.local())
+        yield data_access.get_dynamodb()
+
+
+# moto's in-memory DynamoDB holding empty WeatherLink, Properties, GridpointForecasts and Weather tables
+@pytest.fixture
+def dynamodb(empty_dynamodb):
+    import create_tables
+    create_tables.create_weatherlink_table()
+    create_tables.create_properties_table()
+    create_tables.create_gridpoint_forecasts_table()
+    create_tables.create_weather_table()
+    return empty_dynamodb
+
+
+# Stub of api.weather.gov serving the NWS forecast fixture for every gridpoint, with an ETag
+@pytest.fixture
+def stub_api():
+    from benchmarks.stub_api import StubApi
+    api = StubApi(forecast_fixture=FORECAST_FIXTURE)
+    api.start()
+    yield api
+    api.stop()
@@ -0,0 +1,29 @@
+"""
+Tests of the table upgrades done by create_tables.py, against moto.
+"""
+import create_tables
+
+
+def test_old_weather_table_is_recreated_per_gridpoint(empty_dynamodb):
+    empty_dynamodb.create_table(
+        TableName='Weather',
+        KeySchema=[{'AttributeName': 'property_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'period_number', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'property_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'period_number', 'AttributeType': 'N'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+    )
+
+    create_tables.create_weather_table()
+
+    key_schema = empty_dynamodb.meta.client.describe_table(TableName='Weather')['Table']['KeySchema']
+    assert [key['AttributeName'] for key in key_schema] == ['gridpoint_id', 'period_start']
+
+
+def test_current_weather_table_is_kept(empty_dynamodb):
+    create_tables.create_weather_table()
+    empty_dynamodb.Table('Weather').put_item(Item={'gridpoint_id': 'MKX/1,2', 'period_start': '2024-10-19T10:00:00Z'})
+
+    create_tables.create_weather_table()
+
+    assert empty_dynamodb.Table('Weather').scan()['Count'] == 1
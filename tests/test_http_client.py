@@ -0,0 +1,214 @@
+"""
+Tests of http_client.py against a local stub HTTP server (keep-alive, HTTP/1.1). The stub's host has no rate limit
+budget, so the shared Redis token buckets are never touched and Redis isn't needed.
+"""
+import json
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from decimal import Decimal
+import pytest
+import requests
+import http_client
+from http_client import MODIFIED, NOT_MODIFIED, FAILED
+
+STUB_ETAG = '"v1"'
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.track(self)
+        try:
+            path = self.path.split('?')[0]
+            if path.startswith('/json/'):
+                time.sleep(stub.latency)
+                self.respond(200, json.dumps({'path': path, 'temperature': 21.5}).encode('utf-8'), {'ETag': STUB_ETAG})
+            elif path == '/etag':
+                if self.headers.get('If-None-Match') == STUB_ETAG:
+                    self.respond(304, b'', {'ETag': STUB_ETAG})
+                else:
+                    self.respond(200, b'{"version": 1}', {'ETag': STUB_ETAG})
+            elif path == '/flaky':
+                # Rate limited on the first request only
+                if stub.requests[path] == 1:
+                    self.respond(429, b'', {'Retry-After': '0'})
+                else:
+                    self.respond(200, b'{"ok": true}')
+            elif path == '/slow':
+                time.sleep(stub.slow_delay)
+                self.respond(200, b'{}')
+            elif path == '/invalid-json':
+                self.respond(200, b'<html>not json</html>')
+            elif path.startswith('/status/'):
+                self.respond(int(path.rsplit('/', 1)[-1]), b'')
+            else:
+                self.respond(404, b'')
+        finally:
+            stub.untrack()
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Stub server recording requests per path, the connections they came in on and the most requests in flight at once
+class StubServer:
+    def __init__(self, latency=0.0, slow_delay=1.0):
+        self.latency = latency
+        self.slow_delay = slow_delay
+        self.requests = Counter()
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def track(self, handler):
+        with self.lock:
+            self.requests[handler.path.split('?')[0]] += 1
+            self.connections.add(handler.client_address)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def untrack(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.stop()
+
+
+# Give every test its own session and thread pool, with a small concurrency cap and fast retries
+@pytest.fixture(autouse=True)
+def client(monkeypatch):
+    monkeypatch.setattr(http_client, 'FETCH_CONCURRENCY', 4)
+    monkeypatch.setattr(http_client, 'HTTP_POOL_SIZE', 4)
+    monkeypatch.setattr(http_client, 'HTTP_MAX_RETRIES', 2)
+    monkeypatch.setattr(http_client, 'HTTP_BASE_BACKOFF', 0.01)
+    monkeypatch.setattr(http_client, '_session', None)
+    monkeypatch.setattr(http_client, '_executor', None)
+    yield http_client
+    if http_client._executor is not None:
+        http_client._executor.shutdown(wait=True)
+    if http_client._session is not None:
+        http_client._session.close()
+
+
+def test_iter_fetch_json_returns_one_result_per_url(stub):
+    paths = [f"/json/{index}" for index in range(30)]
+
+    results = dict(http_client.iter_fetch_json(stub.url(path) for path in paths))
+
+    assert results == {stub.url(path): {'path': path, 'temperature': Decimal('21.5')} for path in paths}
+    assert stub.requests.total() == len(paths)
+
+
+def test_iter_fetch_json_caps_concurrency(stub):
+    stub.latency = 0.05
+    urls = [stub.url(f"/json/{index}") for index in range(20)]
+
+    assert len(list(http_client.iter_fetch_json(urls))) == len(urls)
+
+    assert stub.max_in_flight == http_client.FETCH_CONCURRENCY
+
+
+def test_iter_fetch_json_reuses_connections(stub):
+    stub.latency = 0.01
+    urls = [stub.url(f"/json/{index}") for index in range(40)]
+
+    list(http_client.iter_fetch_json(urls))
+
+    # Keep-alive connections of the pooled session are reused instead of opening one per request
+    assert stub.requests.total() == len(urls)
+    assert len(stub.connections) <= http_client.HTTP_POOL_SIZE
+
+
+def test_sequential_requests_share_one_connection(stub):
+    for index in range(10):
+        assert http_client.fetch_json(stub.url(f"/json/{index}")) is not None
+
+    assert len(stub.connections) == 1
+
+
+def test_iter_fetch_json_keeps_going_after_failures(stub):
+    urls = [stub.url('/status/500'), stub.url('/invalid-json'), stub.url('/json/ok'), stub.url('/status/404')]
+
+    results = dict(http_client.iter_fetch_json(urls))
+
+    assert set(results) == set(urls)
+    assert results[stub.url('/json/ok')] is not None
+    assert [results[url] for url in urls if url != stub.url('/json/ok')] == [None, None, None]
+
+
+def test_fetch_json_conditional_statuses(stub):
+    modified = http_client.fetch_json_conditional(stub.url('/etag'))
+    assert modified.status == MODIFIED
+    assert modified.data == {'version': 1}
+    assert modified.etag == STUB_ETAG
+
+    not_modified = http_client.fetch_json_conditional(stub.url('/etag'), etag=modified.etag)
+    assert not_modified == (NOT_MODIFIED, None, STUB_ETAG, None)
+
+    failed = http_client.fetch_json_conditional(stub.url('/status/500'), etag='"old"', last_modified='yesterday')
+    assert failed == (FAILED, None, '"old"', 'yesterday')
+
+
+def test_rate_limited_response_is_retried(stub):
+    result = http_client.fetch_json_conditional(stub.url('/flaky'))
+
+    assert result.status == MODIFIED
+    assert result.data == {'ok': True}
+    assert stub.requests['/flaky'] == 2
+
+
+def test_persistent_rate_limiting_returns_the_last_response(stub):
+    response = http_client.http_get(stub.url('/status/503'))
+
+    assert response.status_code == 503
+    assert stub.requests['/status/503'] == http_client.HTTP_MAX_RETRIES + 1
+
+
+def test_timeout_is_retried_then_raised(stub):
+    stub.slow_delay = 0.5
+
+    with pytest.raises(requests.exceptions.Timeout):
+        http_client.http_get(stub.url('/slow'), timeout=(1, 0.1))
+
+    assert stub.requests['/slow'] == http_client.HTTP_MAX_RETRIES + 1
+
+
+def test_unreachable_host_fails_without_raising():
+    # A port nothing listens on
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        url = f"http://127.0.0.1:{unused.getsockname()[1]}/json/1"
+
+    result = http_client.fetch_json_conditional(url, etag=STUB_ETAG)
+
+    assert result == (FAILED, None, STUB_ETAG, None)
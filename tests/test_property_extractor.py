@@ -0,0 +1,48 @@
+"""
+Tests of the single-pass field reader in property_extractor.py.
+"""
+from lxml import etree
+from property_extractor import extract_property
+
+PROPERTY_XML = b"""
+<Property>
+  <PropertyID>
+    <Identification IDValue="1234"/>
+    <MarketingName>Lakeside</MarketingName>
+    <Email>leasing@example.com</Email>
+    <Address><UnparsedAddress>1 Main St, Madison, WI 53703</UnparsedAddress><City>Madison</City></Address>
+  </PropertyID>
+  <ILS_Unit><Units><Unit><UnitBedrooms>2</UnitBedrooms></Unit><Unit><UnitBedrooms>1.0</UnitBedrooms></Unit></Units></ILS_Unit>
+  <Floorplan>
+    <ILS_Unit><Units><Unit><UnitBedrooms>3</UnitBedrooms><UnitBedrooms>9</UnitBedrooms></Unit></Units></ILS_Unit>
+  </Floorplan>
+  %s
+</Property>
+"""
+
+
+def extract(extra_units=b''):
+    return extract_property(etree.fromstring(PROPERTY_XML % extra_units))
+
+
+def test_fields_are_extracted():
+    record = extract()
+
+    assert (record.property_id, record.city, record.name, record.email) == ('1234', 'Madison', 'Lakeside', 'leasing@example.com')
+    assert record.unparsed_address == '1 Main St, Madison, WI 53703'
+
+
+def test_bedrooms_of_nested_units_are_counted():
+    # The first <UnitBedrooms> of every unit, at any depth: 2 + 1 + 3
+    record = extract()
+
+    assert record.bedrooms == 6
+    assert record.invalid_bedrooms == ()
+
+
+def test_non_numeric_bedrooms_are_reported():
+    record = extract(b'<ILS_Unit><Units><Unit><UnitBedrooms>studio</UnitBedrooms></Unit>'
+                     b'<Unit><UnitBedrooms/></Unit><Unit><UnitBedrooms>4</UnitBedrooms></Unit></Units></ILS_Unit>')
+
+    assert record.bedrooms == 10
+    assert record.invalid_bedrooms == ('studio', None)
@@ -0,0 +1,75 @@
+"""
+Tests of rate_limiter.py's fallback to in-process buckets, with a fake Redis token bucket script that can be made to
+fail (the Redis client itself never connects).
+"""
+import time
+import pytest
+import redis
+from rate_limiter import RateLimiter
+
+HOST_URL = 'https://api.example.test/forecast'
+
+
+# Stand-in for the registered token bucket script: raises RedisError while 'down', otherwise hands out tokens
+class FakeRedisScript:
+    def __init__(self):
+        self.down = False
+        self.calls = 0
+
+    def __call__(self, keys, args):
+        self.calls += 1
+        if self.down:
+            raise redis.exceptions.ConnectionError('Connection refused')
+        return 0
+
+
+@pytest.fixture
+def limiter():
+    limiter = RateLimiter({'api.example.test': (10, 8)}, redis_url='redis://127.0.0.1:1/0',
+                          fallback_processes=4, redis_retry_seconds=0.2)
+    limiter.script = FakeRedisScript()
+    return limiter
+
+
+def test_hosts_without_a_budget_never_touch_redis(limiter):
+    assert limiter.acquire('http://127.0.0.1:8080/anything') == 0.0
+    assert limiter.script.calls == 0
+
+
+def test_redis_is_retried_after_a_failure(limiter):
+    limiter.script.down = True
+    limiter.acquire(HOST_URL)
+    assert limiter.script.calls == 1
+    assert limiter.redis_retry_at is not None
+
+    # Redis recovers, but isn't tried again before the cooldown is over
+    limiter.script.down = False
+    limiter.acquire(HOST_URL)
+    assert limiter.script.calls == 1
+
+    time.sleep(0.25)
+    assert limiter.acquire(HOST_URL) == 0.0
+    assert limiter.script.calls == 2
+    assert limiter.redis_retry_at is None
+
+    # Back on the shared buckets for good
+    for _ in range(5):
+        limiter.acquire(HOST_URL)
+    assert limiter.script.calls == 7
+
+
+def test_fallback_keeps_to_the_process_share_of_the_budget(limiter):
+    limiter.script.down = True
+
+    # 10 requests per second with bursts of 8, shared by 4 processes: 2.5 per second with bursts of 2 each
+    assert limiter._take('api.example.test', 0) == 0.0
+    assert limiter._take('api.example.test', 0) == 0.0
+    assert limiter._take('api.example.test', 0) == pytest.approx(0.4, abs=0.01)
+
+
+def test_pause_applies_to_the_fallback_buckets(limiter):
+    limiter.script.down = True
+
+    limiter.pause(HOST_URL, 5)
+
+    assert limiter._take('api.example.test', 0) == pytest.approx(5, abs=0.1)
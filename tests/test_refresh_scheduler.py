@@ -0,0 +1,61 @@
+"""
+Tests of the gridpoint refresh schedule kept on the GridpointForecasts items, against moto and the stub API.
+"""
+import time
+from refresh_scheduler import (record_gridpoint_check, refresh_priority, load_update_times, parse_nws_time, TIER_DUE,
+                               REFRESH_EXPECTED_UPDATE_INTERVAL, REFRESH_MIN_INTERVAL)
+from scheduled_weather_updater import refresh_weatherlink_rows
+from data_access import scan_weatherlink_segment
+from weather_store import GRIDPOINT_FORECASTS_TABLE
+
+
+def gridpoint_item(dynamodb, gridpoint_id):
+    return dynamodb.Table(GRIDPOINT_FORECASTS_TABLE).get_item(Key={'gridpoint_id': gridpoint_id})['Item']
+
+
+def put_rows(dynamodb, forecast_url, count):
+    table = dynamodb.Table('WeatherLink')
+    for index in range(count):
+        table.put_item(Item={'property_id': f"property-{index}", 'forecast_url': forecast_url})
+
+
+def test_not_modified_sweep_keeps_the_update_time_schedule(dynamodb, stub_api):
+    forecast_url = f"{stub_api.base_url}/gridpoints/MKX/1,2/forecast"
+    put_rows(dynamodb, forecast_url, 3)
+    refresh_weatherlink_rows(scan_weatherlink_segment(0, 1))
+    update_time = gridpoint_item(dynamodb, 'MKX/1,2')['update_time']
+
+    # The full sweep passes no update times: a 304 must not pull the gridpoint back to a REFRESH_MIN_INTERVAL check
+    stats = refresh_weatherlink_rows(scan_weatherlink_segment(0, 1))
+
+    assert stats['not_modified'] == 1
+    item = gridpoint_item(dynamodb, 'MKX/1,2')
+    assert item['update_time'] == update_time
+    assert int(item['next_check_at']) >= int(parse_nws_time(update_time) + REFRESH_EXPECTED_UPDATE_INTERVAL) - 1
+    assert int(item['next_check_at']) > time.time() + REFRESH_MIN_INTERVAL
+
+
+def test_check_stores_the_update_time_of_the_forecast_held(dynamodb, stub_api):
+    forecast_url = f"{stub_api.base_url}/gridpoints/MKX/3,4/forecast"
+    put_rows(dynamodb, forecast_url, 1)
+    refresh_weatherlink_rows(scan_weatherlink_segment(0, 1))
+
+    # NWS reissued the same periods (so the stored forecast wasn't rewritten) with a new updateTime
+    reissued = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time() + 60))
+    record_gridpoint_check(dynamodb, forecast_url, reissued)
+
+    item = gridpoint_item(dynamodb, 'MKX/3,4')
+    assert item['update_time'] == reissued
+    assert load_update_times(dynamodb, [forecast_url]) == {forecast_url: reissued}
+    assert refresh_priority(item, time.time() + REFRESH_EXPECTED_UPDATE_INTERVAL + 120)[0] == TIER_DUE
+
+
+def test_failed_check_keeps_the_stored_update_time(dynamodb):
+    forecast_url = 'https://api.weather.gov/gridpoints/MKX/5,6/forecast'
+    record_gridpoint_check(dynamodb, forecast_url, '2024-10-19T09:58:54+00:00')
+
+    record_gridpoint_check(dynamodb, forecast_url)
+
+    item = gridpoint_item(dynamodb, 'MKX/5,6')
+    assert item['update_time'] == '2024-10-19T09:58:54+00:00'
+    assert int(item['next_check_at']) <= time.time() + REFRESH_MIN_INTERVAL
@@ -0,0 +1,116 @@
+"""
+Tests of the WeatherLink refresh (scheduled_weather_updater.refresh_weatherlink_rows) against moto and the stub API:
+one fetch per forecast URL, conditional GETs with the validators the properties share, and no Properties writes
+when the forecasts are unchanged.
+"""
+import pytest
+import scheduled_weather_updater
+from scheduled_weather_updater import refresh_weatherlink_rows, shared_validators
+from data_access import scan_weatherlink_segment
+from weather_store import WRITTEN, UNCHANGED, WRITE_FAILED
+
+
+@pytest.fixture
+def property_writes(monkeypatch):
+    writes = []
+    update = scheduled_weather_updater.update_weather_data_in_properties
+
+    def record(property_id, *args):
+        writes.append(property_id)
+        return update(property_id, *args)
+
+    monkeypatch.setattr(scheduled_weather_updater, 'update_weather_data_in_properties', record)
+    return writes
+
+
+def put_rows(dynamodb, rows):
+    table = dynamodb.Table('WeatherLink')
+    for property_id, forecast_url, etag in rows:
+        item = {'property_id': property_id, 'forecast_url': forecast_url}
+        if etag:
+            item['etag'] = etag
+        table.put_item(Item=item)
+
+
+def weatherlink_rows():
+    return scan_weatherlink_segment(0, 1)
+
+
+def forecast_url(stub_api, gridpoint):
+    return f"{stub_api.base_url}/gridpoints/MKX/{gridpoint}/forecast"
+
+
+def test_shared_validators():
+    assert shared_validators([{'etag': '"v1"'}, {'etag': '"v1"'}]) == ('"v1"', None)
+    assert shared_validators([{'etag': '"v1"', 'last_modified': 'yesterday'}]) == ('"v1"', 'yesterday')
+    assert shared_validators([{'etag': '"v1"'}, {'etag': '"v2"'}]) == (None, None)
+    assert shared_validators([{'etag': '"v1"'}, {}]) == (None, None)
+
+
+def test_rows_sharing_a_forecast_url_are_fetched_once(dynamodb, stub_api, property_writes):
+    put_rows(dynamodb, [(f"property-{index}", forecast_url(stub_api, f"{index % 2},1"), None) for index in range(6)])
+
+    stats = refresh_weatherlink_rows(weatherlink_rows())
+
+    assert stub_api.requests == {'forecast': 2}
+    assert stats['properties'] == 6
+    assert stats['forecast_urls'] == 2
+    assert stats['gridpoints_written'] == 2
+    assert stats[WRITTEN] == 6
+    assert sorted(property_writes) == [f"property-{index}" for index in range(6)]
+    properties = {item['property_id']: item for item in dynamodb.Table('Properties').scan()['Items']}
+    assert properties['property-3']['gridpoint_id'] == 'MKX/1,1'
+    # The validators of the forecast now held are stored for the next conditional GET
+    assert {row['etag'] for row in weatherlink_rows()} == {'"v1"'}
+
+
+def test_unchanged_forecasts_cost_no_properties_writes(dynamodb, stub_api, property_writes):
+    put_rows(dynamodb, [(f"property-{index}", forecast_url(stub_api, f"{index % 2},1"), None) for index in range(6)])
+    refresh_weatherlink_rows(weatherlink_rows())
+    properties = dynamodb.Table('Properties').scan()['Items']
+    property_writes.clear()
+    stub_api.requests.clear()
+
+    stats = refresh_weatherlink_rows(weatherlink_rows())
+
+    assert stub_api.requests == {'forecast (304)': 2}
+    assert stats['not_modified'] == 2
+    assert (stats['gridpoints_written'], stats[WRITTEN], stats[UNCHANGED], stats[WRITE_FAILED]) == (0, 0, 0, 0)
+    assert property_writes == []
+    assert dynamodb.Table('Properties').scan()['Items'] == properties
+
+
+def test_new_forecast_is_written_to_every_property_of_the_gridpoint(dynamodb, stub_api, property_writes):
+    put_rows(dynamodb, [(f"property-{index}", forecast_url(stub_api, '2,2'), '"v1"') for index in range(3)])
+    stub_api.bump_forecasts()
+
+    stats = refresh_weatherlink_rows(weatherlink_rows())
+
+    assert stub_api.requests == {'forecast': 1}
+    assert stats[WRITTEN] == 3
+    assert {row['etag'] for row in weatherlink_rows()} == {'"v2"'}
+
+
+def test_group_with_mixed_validators_is_fetched_unconditionally(dynamodb, stub_api, property_writes):
+    # One property holds the current forecast, the other doesn't hold any: a 304 would leave the second one without
+    put_rows(dynamodb, [('property-1', forecast_url(stub_api, '3,3'), '"v1"'),
+                        ('property-2', forecast_url(stub_api, '3,3'), None)])
+
+    stats = refresh_weatherlink_rows(weatherlink_rows())
+
+    assert stub_api.requests == {'forecast': 1}
+    assert stats[WRITTEN] == 2
+    assert sorted(property_writes) == ['property-1', 'property-2']
+
+
+def test_refetched_forecast_with_the_same_content_is_not_rewritten(dynamodb, stub_api, property_writes):
+    put_rows(dynamodb, [(f"property-{index}", forecast_url(stub_api, '4,4'), None) for index in range(2)])
+    refresh_weatherlink_rows(weatherlink_rows())
+    # Validators lost (e.g. rows written by an older version), so the same forecast comes back with a 200
+    for row in weatherlink_rows():
+        dynamodb.Table('WeatherLink').update_item(Key={'property_id': row['property_id']}, UpdateExpression='REMOVE etag')
+
+    stats = refresh_weatherlink_rows(weatherlink_rows())
+
+    assert stats['gridpoints_written'] == 0
+    assert (stats[WRITTEN], stats[UNCHANGED]) == (0, 2)
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from decimal import Decimal # Import Decimal to convert floats to Decimals for DynamoDB
 
 def parse_address(unparsed_address):
@@ -16,7 +18,7 @@ def parse_address(unparsed_address):
     return parsed_address
 
 
-# Convert floats to Decimal for DynamoDB
+# Convert floats to Decimal for DynamoDB, returning a converted copy (obj itself is left untouched)
 def convert_floats_to_decimal(obj):
     if isinstance(obj, float):
         return Decimal(str(obj))  # Convert float to Decimal
@@ -25,4 +27,62 @@ def convert_floats_to_decimal(obj):
     elif isinstance(obj, list):
         return [convert_floats_to_decimal(i) for i in obj]  # Recursively process list
     else:
-        return obj  # Return the object as is if it's neither a float, dict, nor list
\ No newline at end of file
+        return obj  # Return the object as is if it's neither a float, dict, nor list
+
+# Convert floats to Decimal for DynamoDB by rewriting obj itself (for large payloads nothing else holds on to)
+def convert_floats_to_decimal_inplace(obj):
+    """
+    Walks the structure iteratively (no recursion limit on deep payloads) and replaces floats in place, so dicts
+    and lists are never rebuilt and subtrees without floats are only visited, not copied.
+    Args: obj: A JSON-like value (dicts, lists and scalars). Its containers are MODIFIED IN PLACE: callers still
+          holding obj see Decimals afterwards. Use convert_floats_to_decimal to keep the original.
+    Returns: The converted value (the same object, unless obj itself is a float).
+    """
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    stack = [obj]
+    while stack:
+        container = stack.pop()
+        if isinstance(container, dict):
+            items = container.items()
+        elif isinstance(container, list):
+            items = enumerate(container)
+        else:
+            continue
+        for key, value in items:
+            if isinstance(value, float):
+                container[key] = Decimal(str(value))  # Replacing a value doesn't resize the dict, so this is safe mid-iteration
+            elif isinstance(value, (dict, list)):
+                stack.append(value)
+    return obj
+
+# Decode JSON with every non-integer number parsed straight to Decimal, ready for DynamoDB without a conversion pass
+def loads_decimal(data):
+    return json.loads(data, parse_float=Decimal)
+
+# Encode JSON that may hold Decimals (as decoded by loads_decimal or read back from DynamoDB)
+def dumps_decimal(value, **kwargs):
+    return json.dumps(value, default=_json_default, **kwargs)
+
+# Encode Decimals as JSON numbers (so a value hashes and serializes the same whether it was decoded as float or
+# Decimal), anything else unknown as its string form
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)  # Decimal('3') came from 3, Decimal('3.0') from 3.0
+    return str(value)
+
+
+# Digest of the forecast periods, used to detect forecasts whose content hasn't changed
+def forecast_digest(weather_data):
+    """
+    Hashes the periods of an NWS forecast. Metadata such as 'generatedAt' changes on every request even when the
+    forecast itself doesn't, so only the periods are included.
+    Args: weather_data (dict): The forecast JSON as returned by api.weather.gov.
+    Returns: str: Hex SHA-256 digest of the canonical JSON encoding of the periods.
+    """
+    return content_digest(weather_data.get('properties', {}).get('periods', []))
+
+# Digest of any JSON-serializable value (key order independent)
+def content_digest(value):
+    canonical = dumps_decimal(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
@@ -1,40 +1,7 @@
 import requests
-import boto3
-from botocore.exceptions import ClientError
-
-# Connect to DynamoDB
-dynamodb = boto3.resource('dynamodb',
-                          endpoint_url='http://localhost:8000',
-                          region_name='dummy',
-                          aws_access_key_id='dummy',
-                          aws_secret_access_key='dummy'
-                          )
-
-def create_weather_table():
-    try:
-        dynamodb.create_table(
-            TableName='Weather',
-            KeySchema=[
-                {'AttributeName': 'period_number', 'KeyType': 'HASH'}
-            ],
-            AttributeDefinitions=[
-                {'AttributeName': 'period_number', 'AttributeType': 'N'}
-            ],
-            ProvisionedThroughput={
-                'ReadCapacityUnits': 10,
-                'WriteCapacityUnits': 10
-            }
-        )
-        print("DynamoDB Weather table created successfully.")
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'ResourceInUseException':
-            print("DynamoDB Weather table already exists.")
-        else:
-            print(f"Unexpected error: {e}")
-
-create_weather_table()
-
-weather_table = dynamodb.Table('Weather')
+from create_tables import create_weather_table
+from data_access import get_dynamodb
+from weather_store import compact_forecast, save_weather_periods, gridpoint_id_from_url, get_upcoming_periods
 
 # example_coord_to_grid_forecast_link = 'https://api.weather.gov/points/43.0727274,-89.3879292'
 
@@ -46,46 +13,46 @@ headers = {
         'User-Agent': 'Mozilla/5.0 (compatible; MyParser/1.0; +https://example.com/my-parser)'  # Adds a User-Agent header to avoid detection
         }
 
-address_to_coord_response = requests.get(address_to_coord_link, headers=headers)
-if address_to_coord_response.status_code == 200:
+# Fetch the forecast URL and forecast of the example address (None, None if any of the API calls fails)
+def fetch_example_forecast():
+    address_to_coord_response = requests.get(address_to_coord_link, headers=headers)
+    if address_to_coord_response.status_code != 200 or not address_to_coord_response.json():
+        return None, None
     address_to_coord_json = address_to_coord_response.json()
     print("Successfully retrieved json")
     lat, long = address_to_coord_json[0]['lat'], address_to_coord_json[0]['lon']
     print(f'Latitude: {lat}, Longitude: {long}')
-    
-if lat and long:
+
     coord_to_grid_link = f'https://api.weather.gov/points/{lat},{long}' # parse
     print(coord_to_grid_link)
     coord_to_grid_response = requests.get(coord_to_grid_link, headers=headers)
-    if coord_to_grid_response.status_code == 200:
-        print("Successfully retrieved coord to grid json")
-        forecast_link = coord_to_grid_response.json()['properties']['forecast']
-        print(forecast_link)
+    if coord_to_grid_response.status_code != 200:
+        return None, None
+    print("Successfully retrieved coord to grid json")
+    forecast_link = coord_to_grid_response.json()['properties']['forecast']
+    print(forecast_link)
 
-if forecast_link:
     forecast_response = requests.get(forecast_link, headers=headers)
-    if forecast_response.status_code == 200:
-        print("Successfully retrieved forecast json")
-        forecast_json = forecast_response.json()
+    if forecast_response.status_code != 200:
+        return None, None
+    print("Successfully retrieved forecast json")
+    return forecast_link, forecast_response.json()
+
+def main():
+    create_weather_table()
+
+    forecast_link, forecast_json = fetch_example_forecast()
+    if forecast_json is None:
+        print("Could not retrieve the forecast")
+        return
+
+    # All periods are written in batches under the gridpoint, so other locations keep their own periods
+    periods_written = save_weather_periods(get_dynamodb(), forecast_link, compact_forecast(forecast_json))
+    print(f"Successfully added {periods_written} items to DynamoDB Weather table")
+
+    for period in get_upcoming_periods(get_dynamodb(), gridpoint_id_from_url(forecast_link)):
+        print(f"{period['period_name']}: {period['temperature']}{period['temperature_unit']}, {period['short_forecast']}")
 
-for period in forecast_json['properties']['periods']:
-    period_number = period['number']
-    print(period_number)
-    precip_val = period['probabilityOfPrecipitation']['value']
-    if not precip_val:
-        precip_val = 0
-        
-    weather_table.put_item(
-        Item = {
-            'period_number': period_number,
-            'period_name': period['name'],
-            'period_start': period['startTime'],
-            'period_end': period['endTime'],
-            'is_daytime': period['isDaytime'],
-            'temperature': f"{period['temperature']}{period['temperatureUnit']}",
-            'precipitation_probability': f"{precip_val}%",
-            'wind': f"{period['windSpeed']} {period['windDirection']}",
-        }
-    )
 
-print("Successfully added items to DynamoDB Weather table")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import zlib
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+from batch_writer import BatchWriter
+from utilities import convert_floats_to_decimal, convert_floats_to_decimal_inplace, dumps_decimal, loads_decimal
+from instrumentation import get_logger, log_sampled
+
+# One item per NWS gridpoint, referenced from Properties items through 'gridpoint_id'
+GRIDPOINT_FORECASTS_TABLE = 'GridpointForecasts'
+
+# Also keep the full NWS payload (zlib-compressed JSON) on the gridpoint item
+STORE_FULL_FORECAST_PAYLOAD = os.environ.get('STORE_FULL_FORECAST_PAYLOAD', 'false').lower() in ('1', 'true', 'yes')
+
+# Forecast periods of every gridpoint, keyed by gridpoint_id and period start (see create_tables.create_weather_table)
+WEATHER_TABLE = 'Weather'
+
+# Seconds a period is kept after it ended before the 'expires_at' TTL removes it
+WEATHER_PERIOD_RETENTION = int(os.environ.get('WEATHER_PERIOD_RETENTION', str(24 * 60 * 60)))
+
+# How far back from now to look for the period in progress (NWS periods last 12 hours at most)
+WEATHER_PERIOD_LOOKBACK = 24 * 60 * 60
+
+# Outcomes of a conditional weather write
+WRITTEN = 'written'
+UNCHANGED = 'unchanged'
+WRITE_FAILED = 'write_failed'
+
+GRIDPOINT_URL_PATTERN = re.compile(r'/gridpoints/([^/]+)/(-?\d+),(-?\d+)')
+
+logger = get_logger('weather_store')
+
+# Derive the gridpoint ID ('<office>/<x>,<y>') from a forecast URL
+def gridpoint_id_from_url(forecast_url):
+    """
+    Args: forecast_url (str): e.g. 'https://api.weather.gov/gridpoints/MKX/38,64/forecast'.
+    Returns: str: The gridpoint ID (e.g. 'MKX/38,64'), or the URL itself if it isn't a gridpoint URL.
+    """
+    match = GRIDPOINT_URL_PATTERN.search(forecast_url)
+    if not match:
+        return forecast_url
+    office, x, y = match.groups()
+    return f"{office}/{x},{y}"
+
+# Keep only the fields we use from each forecast period
+def compact_period(period):
+    precipitation = (period.get('probabilityOfPrecipitation') or {}).get('value')
+    return {
+        'number': period.get('number'),
+        'name': period.get('name'),
+        'start_time': period.get('startTime'),
+        'end_time': period.get('endTime'),
+        'is_daytime': period.get('isDaytime'),
+        'temperature': period.get('temperature'),
+        'temperature_unit': period.get('temperatureUnit'),
+        'precipitation_probability': precipitation if precipitation is not None else 0,
+        'wind_speed': period.get('windSpeed'),
+        'wind_direction': period.get('windDirection'),
+        'short_forecast': period.get('shortForecast'),
+        'detailed_forecast': period.get('detailedForecast')
+    }
+
+# Build the compact representation of an NWS forecast (periods only, no geometry or metadata)
+def compact_forecast(weather_data):
+    properties = weather_data.get('properties', {})
+    return convert_floats_to_decimal_inplace({
+        'update_time': properties.get('updateTime'),
+        'generated_at': properties.get('generatedAt'),
+        'periods': [compact_period(period) for period in properties.get('periods', [])]
+    })
+
+# Convert an NWS timestamp ('2024-10-19T18:00:00-05:00') to UTC ('2024-10-19T23:00:00Z') so range keys sort by time
+def utc_timestamp(value):
+    return format_utc(datetime.fromisoformat(value).timestamp())
+
+# Format epoch seconds the way period_start / period_end are stored
+def format_utc(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# Build the Weather table items of a compact forecast (one per period)
+def weather_period_items(forecast_url, compact):
+    """
+    Args: forecast_url (str): The gridpoint forecast URL. compact (dict): compact_forecast of the NWS forecast.
+    Returns: list: Items keyed by gridpoint_id and UTC period_start, expiring WEATHER_PERIOD_RETENTION after the period.
+    """
+    gridpoint_id = gridpoint_id_from_url(forecast_url)
+    items = {}
+    for period in compact['periods']:
+        if not period.get('start_time') or not period.get('end_time'):
+            continue
+        item = {key: value for key, value in period.items() if key not in ('number', 'name', 'start_time', 'end_time')}
+        item.update({
+            'gridpoint_id': gridpoint_id,
+            'period_start': utc_timestamp(period['start_time']),
+            'period_end': utc_timestamp(period['end_time']),
+            'period_number': period.get('number'),
+            'period_name': period.get('name'),
+            'forecast_url': forecast_url,
+            'update_time': compact['update_time'],
+            'expires_at': int(datetime.fromisoformat(period['end_time']).timestamp()) + WEATHER_PERIOD_RETENTION
+        })
+        items[item['period_start']] = item  # A batch can't hold two writes of the same key
+    return list(items.values())
+
+# Write every period of a gridpoint's forecast to the Weather table in batched writes
+def save_weather_periods(dynamodb, forecast_url, compact):
+    """
+    Periods of a newer forecast overwrite the stored ones with the same start time; periods that are over expire.
+    Returns: int: The number of periods written.
+    """
+    with BatchWriter(dynamodb, WEATHER_TABLE) as period_writer:
+        for item in weather_period_items(forecast_url, compact):
+            period_writer.put(item)
+    if period_writer.failed:
+        print(f"Failed to write {len(period_writer.failed)} forecast periods for {forecast_url}")
+    return period_writer.items_written
+
+# Read the next forecast periods of a gridpoint, starting with the one in progress
+def get_upcoming_periods(dynamodb, gridpoint_id, limit=14, now=None):
+    """
+    Args:
+        gridpoint_id (str): The gridpoint ID (see gridpoint_id_from_url).
+        limit (int): Most periods to return.
+        now (float): Epoch seconds to look forward from (defaults to the current time).
+    Returns: list: Weather table items sorted by period_start (empty if the table can't be read).
+    """
+    now = time.time() if now is None else now
+    query_kwargs = {
+        'KeyConditionExpression': Key('gridpoint_id').eq(gridpoint_id) & Key('period_start').gte(format_utc(now - WEATHER_PERIOD_LOOKBACK)),
+        'FilterExpression': Attr('period_end').gt(format_utc(now))
+    }
+    periods = []
+    try:
+        while len(periods) < limit:
+            response = dynamodb.Table(WEATHER_TABLE).query(**query_kwargs)
+            periods.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except ClientError as e:
+        print(f"Error reading forecast periods for gridpoint {gridpoint_id}: {e}")
+        return []
+    return periods[:limit]
+
+# Compress the full forecast JSON for optional storage as a DynamoDB binary attribute
+def compress_payload(weather_data):
+    return Binary(zlib.compress(dumps_decimal(weather_data, separators=(',', ':')).encode('utf-8')))
+
+# Decompress a payload stored by compress_payload
+def decompress_payload(payload):
+    return loads_decimal(zlib.decompress(bytes(payload.value if isinstance(payload, Binary) else payload)))
+
+# Save a gridpoint's forecast once, for every property that references it
+def save_gridpoint_forecast(dynamodb, forecast_url, weather_data, digest):
+    """
+    Writes the compact forecast (and the compressed full payload when STORE_FULL_FORECAST_PAYLOAD is set) to the
+    GridpointForecasts table, unless the stored digest shows the content is unchanged. A written forecast also
+    rewrites the gridpoint's periods in the Weather table.
+    Args:
+        dynamodb: boto3 DynamoDB service resource.
+        forecast_url (str): The gridpoint forecast URL.
+        weather_data (dict): The forecast JSON as returned by api.weather.gov.
+        digest (str): forecast_digest of weather_data.
+    Returns: str: WRITTEN, UNCHANGED or WRITE_FAILED.
+    """
+    compact = compact_forecast(weather_data)
+    item = {
+        'gridpoint_id': gridpoint_id_from_url(forecast_url),
+        'forecast_url': forecast_url,
+        'digest': digest,
+        'update_time': compact['update_time'],
+        'generated_at': compact['generated_at'],
+        'periods': compact['periods'],
+        'stored_at': int(time.time())
+    }
+    if STORE_FULL_FORECAST_PAYLOAD:
+        item['payload'] = compress_payload(weather_data)
+
+    try:
+        dynamodb.Table(GRIDPOINT_FORECASTS_TABLE).put_item(
+            Item=item,
+            ConditionExpression="attribute_not_exists(digest) OR digest <> :digest",
+            ExpressionAttributeValues={':digest': digest}
+        )
+        log_sampled(logger, "Forecast saved for gridpoint %s", item['gridpoint_id'])
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return UNCHANGED
+        print(f"Error saving forecast for gridpoint {item['gridpoint_id']}: {e}")
+        return WRITE_FAILED
+
+    # The periods only change with the forecast, so they are rewritten together with it
+    save_weather_periods(dynamodb, forecast_url, compact)
+    return WRITTEN
+
+# Read a gridpoint's stored forecast (with the full payload decompressed under 'payload' when it was stored)
+def get_gridpoint_forecast(dynamodb, gridpoint_id):
+    try:
+        response = dynamodb.Table(GRIDPOINT_FORECASTS_TABLE).get_item(Key={'gridpoint_id': gridpoint_id})
+    except ClientError as e:
+        print(f"Error reading forecast for gridpoint {gridpoint_id}: {e}")
+        return None
+    item = response.get('Item')
+    if item and 'payload' in item:
+        item['payload'] = decompress_payload(item['payload'])
+    return item
+
+# Write a property's weather summary and gridpoint reference, skipping it when nothing changed
+def save_property_weather(dynamodb, property_id, gridpoint_id, parsed_weather_data, detailed_forecast, digest, conditional=True):
+    """
+    Stores only the next-period summary and the gridpoint reference on the Properties item (the full forecast
+    lives once per gridpoint in GridpointForecasts). Removes the full 'weather_data' blob older versions stored.
+    When 'conditional' is set the write only happens if 'digest' differs from the stored 'weather_digest'.
+    Returns: str: WRITTEN, UNCHANGED or WRITE_FAILED.
+    """
+    update_kwargs = {
+        'Key': {'property_id': property_id},
+        'UpdateExpression': "SET gridpoint_id = :gridpoint_id, next_period_weather_data = :next_period_weather_data, next_period_forecast = :next_period_forecast, weather_digest = :digest REMOVE weather_data",
+        'ExpressionAttributeValues': {
+            ':gridpoint_id': gridpoint_id,
+            ':next_period_weather_data': convert_floats_to_decimal(parsed_weather_data),
+            ':next_period_forecast': detailed_forecast,
+            ':digest': digest
+        }
+    }
+    if conditional:
+        update_kwargs['ConditionExpression'] = "attribute_not_exists(weather_digest) OR weather_digest <> :digest"
+
+    try:
+        dynamodb.Table('Properties').update_item(**update_kwargs)
+        log_sampled(logger, "Weather data updated for property_id %s", property_id)
+        return WRITTEN
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return UNCHANGED
+        print(f"Error updating weather data for {property_id}: {e}")
+        return WRITE_FAILED
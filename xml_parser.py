@@ -1,232 +1,317 @@
-import boto3
+import argparse
+import logging
+import os
 import time
 import uuid
-from lxml import etree
-from botocore.exceptions import ClientError
-from create_tables import create_properties_table, create_weatherlink_table, create_statistics_table
-from utilities import parse_address
-from background_tasks import queue_weather_job  # Celery task
+from batch_writer import BatchWriter
+from create_tables import create_properties_table, create_weatherlink_table, create_statistics_table, create_statistics_details_table, create_geocode_cache_table, create_points_cache_table, create_gridpoint_forecasts_table, create_weather_table
+from feed_reader import iter_property_records
+from property_index import property_fingerprint, load_property_fingerprints, classify_property, ADDED, CHANGED, UNCHANGED
+from run_statistics import RunStatisticsAccumulator, DEFAULT_DETAIL_SHARDS
+from background_tasks import queue_weather_job, queue_weather_jobs_batch  # Celery tasks
+from data_access import get_dynamodb, put_run_statistics, get_run_statistics, delete_weatherlink_item, scan_properties
+from instrumentation import timed_iter, increment, get_logger, log_sampled, configure_logging, start_metrics_server
+from profiling import profile_run, PROFILE_MODE, PROFILE_MODES
 from decimal import Decimal  # Import Decimal
 
-# Start the overall timer for the parsing run
-start_time = time.time()
-
-# Connect to local DynamoDB instance
-dynamodb = boto3.resource('dynamodb',
-                          endpoint_url='http://localhost:8000',
-                          region_name='dummy',
-                          aws_access_key_id='dummy',
-                          aws_secret_access_key='dummy'
-                          )
-
-# Increment atomic counters in DynamoDB
-def increment_statistic(run_id, field, increment_by=1):
-    """
-    Increment a numeric field in the RunStatistics table atomically.
-
-    Args:
-        run_id (str): The ID of the run for which we are updating the statistics.
-        field (str): The field to increment (e.g., 'successful_api_calls').
-        increment_by (int): The amount to increment by.
-    """
-    statistics_table = dynamodb.Table('RunStatistics')
-    try:
-        statistics_table.update_item(
-            Key={'run_id': run_id},
-            UpdateExpression=f"SET {field} = if_not_exists({field}, :start) + :inc",
-            ExpressionAttributeValues={
-                ':inc': increment_by,
-                ':start': 0
-            }
-        )
-    except ClientError as e:
-        print(f"Error incrementing {field} in DynamoDB: {e}")
-
-# Add an entry to a list field in DynamoDB
-def add_to_list(run_id, field, item):
-    """
-    Append an item to a list field in the RunStatistics table.
-    """
-    statistics_table = dynamodb.Table('RunStatistics')
-    try:
-        statistics_table.update_item(
-            Key={'run_id': run_id},
-            UpdateExpression=f"SET {field} = list_append(if_not_exists({field}, :empty_list), :item)",
-            ExpressionAttributeValues={
-                ':item': [item],
-                ':empty_list': []
-            }
-        )
-    except ClientError as e:
-        print(f"Error appending to {field} in DynamoDB: {e}")
+# Feed location and parse mode ('stream' parses one <Property> at a time with iterparse, 'tree' loads the whole document,
+# 'parallel' splits the file into byte ranges of whole <Property> elements parsed across a pool of worker processes)
+XML_FEED_PATH = os.environ.get('XML_FEED_PATH', 'abodo_feed.xml')
+XML_PARSE_MODE = os.environ.get('XML_PARSE_MODE', 'stream')
+
+# Worker processes and target byte range size per task for the 'parallel' parse mode
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', '0')) or os.cpu_count()
+PARSE_CHUNK_BYTES = int(os.environ.get('PARSE_CHUNK_BYTES', str(8 * 1024 * 1024)))
+
+# Number of Properties items written per BatchWriteItem call (DynamoDB allows at most 25)
+PROPERTY_WRITE_BATCH_SIZE = int(os.environ.get('PROPERTY_WRITE_BATCH_SIZE', '25'))
+
+# Number of properties per weather task message (1 queues one queue_weather_job per property)
+WEATHER_JOB_CHUNK_SIZE = int(os.environ.get('WEATHER_JOB_CHUNK_SIZE', '25'))
+
+# Seconds between run statistics flushes to the RunStatistics table (0 only flushes at the end of the run)
+STATS_FLUSH_INTERVAL = float(os.environ.get('STATS_FLUSH_INTERVAL', '5'))
+
+# Incremental ingestion: only write (and queue weather jobs for) properties whose content changed since the last run,
+# and delete stored properties that are no longer in the feed
+INCREMENTAL_INGEST = os.environ.get('INCREMENTAL_INGEST', 'false').lower() in ('1', 'true', 'yes')
+
+logger = get_logger('xml_parser')
 
 # Create DynamoDB tables if necessary
-create_statistics_table()
-create_properties_table()
-create_weatherlink_table()
-
-# Access the tables
-property_table = dynamodb.Table('Properties')
-run_statistics_table = dynamodb.Table('RunStatistics')
-
-
-# Parse XML file
-print("Parsing XML file 'abodo_feed.xml'...")
-tree = etree.parse('abodo_feed.xml')
-root = tree.getroot()
-
-properties = []  # List to store extracted property data
-
-properties_elems = root.findall('.//Property')
-
-total_properties = len(properties_elems)
-
-print(f"Found {total_properties} properties in the XML file.")
-
-# Initialize metrics
-target_properties_processed = 0
-total_target_parsing_time = Decimal('0')
-total_background_time = Decimal('0')  # Total time for background tasks
-total_background_api_call_time = Decimal('0')  # Total time for individual API calls
-background_api_calls_count = 0
-
-
-
-# Generate a unique run ID
-run_id = str(uuid.uuid4())
-
-# Create initial statistics entry in DynamoDB
-run_statistics_table.put_item(Item={
-    'run_id': run_id,
-    'total_properties_in_xml': total_properties,
-    'target_properties_processed': 0,
-    'duplicate_targets_skipped': 0,
-    'successful_api_calls': 0,
-    'total_target_parsing_time': Decimal('0'),
-    'average_parse_time_per_target_property': Decimal('0'),
-    'average_time_per_property_background': Decimal('0'),
-    'average_api_call_time': Decimal('0'),
-    'properties_added': 0,
-    'property_runtimes': [],
-    'background_job_details': [],
-    'total_run_time': Decimal('0')  # Add a field to track total run time
-})
-
-# Use a set to track unique property IDs
-unique_property_ids = set()
-
-total_bedrooms = 0
-
-for property_elem in properties_elems:
-    # Track property_id and skip duplicates
-    property_id = property_elem.xpath('./PropertyID/Identification/@IDValue')[0]
-    if property_id in unique_property_ids:
-        print(f"Skipping duplicate property {property_id}")
-        # Increment the "duplicate_targets_skipped" counter atomically
-        increment_statistic(run_id, 'duplicate_targets_skipped')
-        continue
+def ensure_tables():
+    create_statistics_table()
+    create_statistics_details_table()
+    create_properties_table()
+    create_weatherlink_table()
+    create_geocode_cache_table()
+    create_points_cache_table()
+    create_gridpoint_forecasts_table()
+    create_weather_table()
+
+# Fingerprints of the properties stored by previous runs and the IDs of those without weather ((None, None) for a full load)
+def load_stored_fingerprints():
+    if not INCREMENTAL_INGEST:
+        return None, None
+    stored_fingerprints, without_weather = load_property_fingerprints(get_dynamodb())
+    if stored_fingerprints is None:
+        print("Could not read stored property fingerprints, falling back to a full load")
     else:
-        unique_property_ids.add(property_id)
-    
-    # Extract property if in Madison
-    city_elem = property_elem.xpath('./PropertyID/Address/City')
-
-    # Calculate number of bedrooms
-    bedrooms = sum([int(float(unit.find('./UnitBedrooms').text)) 
-                    for ils_unit in property_elem.findall('.//ILS_Unit') 
-                    for units in ils_unit.findall('./Units') 
-                    for unit in units.findall('./Unit')])
-    
-    total_bedrooms += bedrooms
-
-    if city_elem and city_elem[0].text == 'Madison':
-        # Increment total properties processed counter
-        target_properties_processed += 1
-
-        # Track time for each property in the parser
-        start_parse_time = time.time()
-
-        print("Processing property in Madison...")
-        property_id = property_elem.xpath('./PropertyID/Identification/@IDValue')
-        marketing_name = property_elem.xpath('./PropertyID/MarketingName')
-        email = property_elem.xpath('./PropertyID/Email')
-        unparsed_address = property_elem.xpath('./PropertyID/Address/UnparsedAddress')[0].text
-        print(f"Unparsed address: {unparsed_address}")
-        parsed_address = parse_address(unparsed_address)
-        print(f"Parsed address: {parsed_address}")
-        
-        property_info = {
-            'property_id': property_id[0] if property_id else None,
-            'name': marketing_name[0].text if marketing_name else None,
-            'email': email[0].text if email else None,
-            'bedrooms': bedrooms
-        }
-
-        properties.append(property_info)  # Add the dictionary to the properties list
-
-        print(f"Extracted property info: {property_info}")
-
-        # Insert into DynamoDB
-        property_table.put_item(Item={
-            'property_id': property_info['property_id'],
-            'name': property_info['name'],
-            'email': property_info['email'],
-            'bedrooms': str(property_info['bedrooms'])
-        })
-
-        print(f"Property {property_info['property_id']} added to DynamoDB.")
-
-        # Track parsing time for this property and accumulate total time
-        end_parse_time = time.time()
-        time_taken = Decimal(str(end_parse_time - start_parse_time))
-        total_target_parsing_time += time_taken
-        
-        # Add property and runtime to the list in DynamoDB
-        add_to_list(run_id, 'property_runtimes', {'property_id': property_info['property_id'], 'parser_runtime': str(time_taken)})
-
-        # Track background job time and get API result
-        print(f"Queueing background job for property {property_info['property_id']}...")
-        queue_weather_job.delay(property_info['property_id'], parsed_address, run_id)
-
-        # Increment the properties added counter atomically
-        increment_statistic(run_id, 'properties_added')
-
-# Calculate the average time per property in the parser
-average_parse_time_per_target_property = total_target_parsing_time / target_properties_processed if target_properties_processed > 0 else Decimal('0')
-
-# Calculate the total run time
-total_run_time = Decimal(str(time.time() - start_time))
-
-# Update total and average time in DynamoDB
-run_statistics_table.update_item(
-    Key={'run_id': run_id},
-    UpdateExpression="SET total_target_parsing_time = :total_time, average_parse_time_per_target_property = :avg_time, total_run_time = :run_time, target_properties_processed = :target_count",
-    ExpressionAttributeValues={
-        ':total_time': total_target_parsing_time,
-        ':avg_time': average_parse_time_per_target_property,
-        ':run_time': total_run_time,
-        ':target_count': target_properties_processed
-    }
-)
-
-print("Data successfully saved to DynamoDB")
-
-print(f'Unique properties: {len(unique_property_ids)}')
-print(f'Total bedrooms (excluding duplicate properties): {total_bedrooms}')
-
-# Print final statistics from DynamoDB
-response = run_statistics_table.get_item(Key={'run_id': run_id})
-print("Final run statistics:")
-print(response['Item'])
-
-# Output the properties
-print("Target properties extracted from XML (excluding duplicates):")
-for prop in properties:
-    print(prop)
-
-# Scan DynamoDB table and print all items
-print("Scanning DynamoDB table 'Properties' for all items...")
-scanResponse = property_table.scan()
-responseItems = scanResponse['Items']
-for item in responseItems:
-    print(item)
+        print(f"Incremental ingest: {len(stored_fingerprints)} properties stored by previous runs, {len(without_weather)} without weather")
+    return stored_fingerprints, without_weather
+
+# Delete properties stored by a previous run that are no longer target properties in the feed
+def delete_removed_properties(stored_fingerprints, target_property_ids, run_stats):
+    removed_property_ids = sorted(set(stored_fingerprints) - target_property_ids)
+    if removed_property_ids and not target_property_ids:
+        # An empty or broken feed must not wipe the table
+        print(f"No target properties in the feed, skipping deletion of {len(removed_property_ids)} stored properties")
+    elif removed_property_ids:
+        print(f"Deleting {len(removed_property_ids)} properties no longer in the feed: {removed_property_ids}")
+        with BatchWriter(get_dynamodb(), 'Properties') as property_deleter, BatchWriter(get_dynamodb(), 'WeatherLink') as weatherlink_deleter:
+            for property_id in removed_property_ids:
+                property_deleter.delete({'property_id': property_id})
+                weatherlink_deleter.delete({'property_id': property_id})
+        run_stats.increment('targets_deleted', property_deleter.items_written)
+
+# Parse the feed, store the target properties and queue their weather jobs (returns the run ID)
+def main():
+    # Start the overall timer for the parsing run
+    start_time = time.time()
+
+    # Per-property messages are sampled log records, and the stage histograms are served while the run lasts
+    configure_logging()
+    start_metrics_server()
+
+    ensure_tables()
+
+    stored_fingerprints, without_weather = load_stored_fingerprints()
+    ingest_mode = 'incremental' if stored_fingerprints is not None else 'full'
+
+    # Parse XML file
+    print(f"Parsing XML file '{XML_FEED_PATH}' (mode: {XML_PARSE_MODE})...")
+    # The 'parse' stage histogram times how long each record took to come out of the feed reader
+    property_records = timed_iter('parse', iter_property_records(XML_FEED_PATH, mode=XML_PARSE_MODE, workers=PARSE_WORKERS, chunk_bytes=PARSE_CHUNK_BYTES))
+
+    # Properties are counted as they are parsed, so the total is only known at the end of the run
+    total_properties = 0
+
+    properties = []  # List to store extracted property data (only kept to be logged at DEBUG)
+    keep_properties = logger.isEnabledFor(logging.DEBUG)
+
+    # Initialize metrics
+    target_properties_processed = 0
+    total_target_parsing_time = Decimal('0')
+
+
+
+    # Generate a unique run ID
+    run_id = str(uuid.uuid4())
+
+    # Create initial statistics entry in DynamoDB
+    put_run_statistics({
+        'run_id': run_id,
+        'total_properties_in_xml': total_properties,
+        'target_properties_processed': 0,
+        'duplicate_targets_skipped': 0,
+        'total_target_parsing_time': Decimal('0'),
+        'average_parse_time_per_target_property': Decimal('0'),
+        'properties_added': 0,
+        'ingest_mode': ingest_mode,
+        'targets_added': 0,  # Added / changed / unchanged / deleted target properties (incremental ingest only)
+        'targets_changed': 0,
+        'targets_unchanged': 0,
+        'targets_deleted': 0,
+        'targets_weather_retried': 0,  # Unchanged target properties queued again because they have no weather yet
+        'detail_shards': DEFAULT_DETAIL_SHARDS,  # Per-property records live in the sharded RunStatisticsDetails table
+        'total_run_time': Decimal('0')  # Add a field to track total run time
+    })
+
+    # Counters, timings and per-property records are accumulated locally and flushed in coalesced updates
+    run_stats = RunStatisticsAccumulator(get_dynamodb(), run_id, flush_interval=STATS_FLUSH_INTERVAL)
+
+    # Properties waiting to be written to DynamoDB (property_id -> (parsed_address, parser runtime, ADDED or CHANGED))
+    pending_properties = {}
+
+    # Weather jobs waiting to be sent as one chunk ([property_id, parsed_address] pairs)
+    pending_weather_jobs = []
+
+    # Queue a weather job, sending the pending ones as a single batch task once a chunk is full (or when forced)
+    def queue_weather(property_id=None, parsed_address=None, force=False):
+        if WEATHER_JOB_CHUNK_SIZE <= 1:
+            if property_id is not None:
+                queue_weather_job.delay(property_id, parsed_address, run_id)
+            return
+        if property_id is not None:
+            pending_weather_jobs.append([property_id, parsed_address])
+        if pending_weather_jobs and (force or len(pending_weather_jobs) >= WEATHER_JOB_CHUNK_SIZE):
+            print(f"Queueing background job for {len(pending_weather_jobs)} properties...")
+            queue_weather_jobs_batch.delay(list(pending_weather_jobs), run_id)
+            pending_weather_jobs.clear()
+
+    # Once a batch of properties is stored, record their runtimes and queue their weather jobs
+    def on_properties_written(items):
+        for item in items:
+            property_id = item['property_id']
+            parsed_address, time_taken, status = pending_properties.pop(property_id)
+            log_sampled(logger, "Property %s added to DynamoDB.", property_id)
+            run_stats.record_detail('property_runtime', property_id, {'property_id': property_id, 'parser_runtime': time_taken})
+
+            # The address may have changed, so the stored forecast URL can't be trusted (geocoding is cached anyway)
+            if status == CHANGED:
+                delete_weatherlink_item(property_id)
+
+            # Weather jobs update the stored item, so they are only queued after the put has gone through
+            log_sampled(logger, "Queueing background job for property %s...", property_id)
+            queue_weather(property_id, parsed_address)
+
+        run_stats.increment('properties_added', len(items))
+        increment('properties_written', len(items))
+
+    property_writer = BatchWriter(get_dynamodb(), 'Properties', batch_size=PROPERTY_WRITE_BATCH_SIZE, on_flush=on_properties_written)
+
+    # Use a set to track unique property IDs
+    unique_property_ids = set()
+
+    # Target properties in this feed (anything else stored by a previous run is deleted in incremental mode)
+    target_property_ids = set()
+
+    total_bedrooms = 0
+
+    properties_seen = 0
+
+    for record in property_records:
+        properties_seen += 1
+
+        # Track property_id and skip duplicates (records arrive in feed order in every parse mode)
+        property_id = record.property_id
+        if property_id is None:
+            log_sampled(logger, "Skipping property without a PropertyID")
+            increment('properties_skipped', reason='missing_id')
+            continue
+        if property_id in unique_property_ids:
+            log_sampled(logger, "Skipping duplicate property %s", property_id)
+            # Count the skipped duplicate (flushed to DynamoDB with the other run statistics)
+            run_stats.increment('duplicate_targets_skipped')
+            increment('properties_skipped', reason='duplicate')
+            continue
+        else:
+            unique_property_ids.add(property_id)
+
+        bedrooms = record.bedrooms
+        total_bedrooms += bedrooms
+        if record.invalid_bedrooms:
+            log_sampled(logger, "Property %s has non-numeric UnitBedrooms values %s, not counted", property_id, list(record.invalid_bedrooms))
+            increment('invalid_bedrooms', len(record.invalid_bedrooms))
+
+        # Extract property if in Madison
+        if record.city == 'Madison':
+            # Increment total properties processed counter
+            target_properties_processed += 1
+
+            # Track time for each property in the parser
+            start_parse_time = time.time()
+
+            log_sampled(logger, "Processing property in Madison...")
+            log_sampled(logger, "Unparsed address: %s", record.unparsed_address)
+            parsed_address = record.parsed_address
+            log_sampled(logger, "Parsed address: %s", parsed_address)
+
+            property_info = {
+                'property_id': property_id,
+                'name': record.name,
+                'email': record.email,
+                'bedrooms': bedrooms
+            }
+
+            if keep_properties:
+                properties.append(property_info)  # Add the dictionary to the properties list
+
+            log_sampled(logger, "Extracted property info: %s", property_info)
+
+            # Track parsing time for this property and accumulate total time
+            end_parse_time = time.time()
+            time_taken = Decimal(str(end_parse_time - start_parse_time))
+            total_target_parsing_time += time_taken
+
+            property_item = {
+                'property_id': property_info['property_id'],
+                'name': property_info['name'],
+                'email': property_info['email'],
+                'bedrooms': str(property_info['bedrooms'])
+            }
+            property_item['content_fingerprint'] = property_fingerprint(property_item, parsed_address)
+            target_property_ids.add(property_id)
+
+            # Unchanged properties keep their stored item and weather, so there is nothing to write or queue, unless
+            # an earlier weather job failed to save their weather (their stored item is current, so it is queued now)
+            status = ADDED
+            if stored_fingerprints is not None:
+                status = classify_property(stored_fingerprints, property_id, property_item['content_fingerprint'])
+                run_stats.increment(f"targets_{status}")
+                if status == UNCHANGED:
+                    if property_id in without_weather:
+                        log_sampled(logger, "Queueing background job for unchanged property %s without weather...", property_id)
+                        run_stats.increment('targets_weather_retried')
+                        queue_weather(property_id, parsed_address)
+                    continue
+
+            # Queue the item for a batched insert into DynamoDB (the weather job is queued once it is written)
+            pending_properties[property_id] = (parsed_address, time_taken, status)
+            property_writer.put(property_item)
+
+    # Write any remaining buffered properties and send the last partial chunk of weather jobs
+    property_writer.flush()
+    queue_weather(force=True)
+    if property_writer.failed:
+        print(f"Failed to write {len(property_writer.failed)} properties to DynamoDB: {sorted(pending_properties)}")
+    print(f"Wrote {property_writer.items_written} properties in {property_writer.batch_calls} batch write calls.")
+
+    # Delete properties stored by a previous run that are no longer target properties in the feed
+    if stored_fingerprints is not None:
+        delete_removed_properties(stored_fingerprints, target_property_ids, run_stats)
+
+    total_properties = properties_seen
+    print(f"Found {total_properties} properties in the XML file.")
+
+    # Calculate the average time per property in the parser
+    average_parse_time_per_target_property = total_target_parsing_time / target_properties_processed if target_properties_processed > 0 else Decimal('0')
+
+    # Calculate the total run time
+    total_run_time = Decimal(str(time.time() - start_time))
+
+    # Update total and average time in DynamoDB, together with any statistics not yet flushed
+    run_stats.set('total_properties_in_xml', total_properties)
+    run_stats.set('total_target_parsing_time', total_target_parsing_time)
+    run_stats.set('average_parse_time_per_target_property', average_parse_time_per_target_property)
+    run_stats.set('total_run_time', total_run_time)
+    run_stats.set('target_properties_processed', target_properties_processed)
+    run_stats.flush()
+
+    print("Data successfully saved to DynamoDB")
+
+    print(f'Unique properties: {len(unique_property_ids)}')
+    print(f'Total bedrooms (excluding duplicate properties): {total_bedrooms}')
+
+    # Print final statistics from DynamoDB
+    print("Final run statistics:")
+    print(get_run_statistics(run_id))
+
+    # Output the properties and every stored item (at DEBUG only: at volume this is most of the console output)
+    if keep_properties:
+        logger.debug("Target properties extracted from XML (excluding duplicates):")
+        for prop in properties:
+            logger.debug("%s", prop)
+
+        logger.debug("Scanning DynamoDB table 'Properties' for all items...")
+        for item in scan_properties():
+            logger.debug("%s", item)
+
+    return run_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parse the XML feed, store the target properties and queue their weather jobs")
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=PROFILE_MODE or None,
+                        help="profile the run with cProfile ('cpu'), tracemalloc ('memory') or both ('all')")
+    profile_run('parser', main, parser.parse_args().profile)